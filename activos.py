@@ -0,0 +1,51 @@
+"""
+Caché de activos estáticos (logo) por proceso.
+
+El logo se decodifica una sola vez, se redimensiona al ancho en que se
+muestra (en pantalla o en el Excel) y se guardan los bytes PNG de esa
+versión. Se invalida si cambia el mtime del archivo.
+"""
+import os
+import threading
+from collections import namedtuple
+from io import BytesIO
+
+Logo = namedtuple("Logo", ["display_png", "ancho", "alto"])
+
+_logos = {}  # (ruta, ancho) -> (mtime, Logo)
+_logos_lock = threading.Lock()
+
+
+def _cargar(ruta, ancho):
+    from PIL import Image
+
+    with Image.open(ruta) as original:
+        img = original.copy()
+    if ancho and img.width > ancho:
+        alto = round(img.height * ancho / img.width)
+        img = img.resize((ancho, alto), Image.LANCZOS)
+    salida = BytesIO()
+    img.save(salida, format="PNG", optimize=True)
+    return Logo(display_png=salida.getvalue(), ancho=img.width, alto=img.height)
+
+
+def cargar_logo(ruta, ancho=220):
+    """Logo listo para st.image / insert_image, o None si no existe o no se puede leer."""
+    try:
+        mtime = os.stat(ruta).st_mtime_ns
+    except OSError:
+        return None
+    clave = (os.path.abspath(ruta), ancho)
+    entrada = _logos.get(clave)
+    if entrada is not None and entrada[0] == mtime:
+        return entrada[1]
+    with _logos_lock:
+        entrada = _logos.get(clave)
+        if entrada is not None and entrada[0] == mtime:
+            return entrada[1]
+        try:
+            logo = _cargar(ruta, ancho)
+        except Exception:
+            return None
+        _logos[clave] = (mtime, logo)
+        return logo
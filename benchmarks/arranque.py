@@ -0,0 +1,73 @@
+"""
+Chequeo de arranque en frío de la página principal.
+
+Lanza un intérprete nuevo, mide el primer render de trip_app.py con el
+AppTest de Streamlit y revisa que las dependencias pesadas (pandas,
+xlsxwriter, requests, openpyxl) sigan sin importarse hasta que se usen.
+Sale con código 1 si se pasa del presupuesto o si alguna se importó.
+
+    python benchmarks/arranque.py [--presupuesto 3.0] [--pagina trip_app.py]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PRESUPUESTO_S = float(os.getenv("VIATICOS_ARRANQUE_MAX_S", 3.0))
+# PIL no entra: el logo se decodifica en el primer render
+PESADOS = ["pandas", "xlsxwriter", "openpyxl", "requests"]
+
+_SONDA = """
+import json, sys, time
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+t_st = time.perf_counter() - t0
+at = AppTest.from_file(sys.argv[1], default_timeout=60)
+t1 = time.perf_counter()
+at.run()
+t_render = time.perf_counter() - t1
+print(json.dumps({
+    "streamlit_s": t_st,
+    "primer_render_s": t_render,
+    "excepciones": [str(e.value) for e in at.exception],
+    "importados": [m for m in json.loads(sys.argv[2]) if m in sys.modules],
+}))
+"""
+
+
+def medir(pagina):
+    salida = subprocess.run(
+        [sys.executable, "-c", _SONDA, pagina, json.dumps(PESADOS)],
+        cwd=RAIZ, capture_output=True, text=True, check=True,
+    )
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--presupuesto", type=float, default=PRESUPUESTO_S,
+                        help="segundos máximos para el primer render (sin contar importar streamlit)")
+    parser.add_argument("--pagina", default="trip_app.py")
+    args = parser.parse_args(argv)
+
+    r = medir(os.path.join(RAIZ, args.pagina))
+    print(f"importar streamlit: {r['streamlit_s']:.2f} s")
+    print(f"primer render:      {r['primer_render_s']:.2f} s (presupuesto {args.presupuesto:.2f} s)")
+    print(f"pesados cargados:   {', '.join(r['importados']) or 'ninguno'}")
+
+    fallas = []
+    if r["excepciones"]:
+        fallas.append(f"la página lanzó excepciones: {r['excepciones']}")
+    if r["primer_render_s"] > args.presupuesto:
+        fallas.append("primer render fuera de presupuesto")
+    if r["importados"]:
+        fallas.append(f"se importaron en el arranque: {', '.join(r['importados'])}")
+    for falla in fallas:
+        print(f"FALLA: {falla}")
+    return 1 if fallas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+"""
+Suite de benchmarks: cálculo, costeo por lotes, auto-ajuste y exportación a
+1 / 1k / 100k filas, y búsquedas de distancia contra el proveedor falso
+(benchmarks/proveedor_falso.py) con latencia y errores configurables.
+
+    python benchmarks/correr.py                          # corre y muestra
+    python benchmarks/correr.py --guardar base.json      # guarda la línea base
+    python benchmarks/correr.py --comparar base.json     # sale con 1 si algo empeoró
+
+La comparación usa el mejor tiempo de cada caso (el menos sensible al ruido
+de la máquina); un caso es regresión si tarda más de (1 + --tolerancia)
+veces la línea base. Conviene guardar y comparar en la misma máquina.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Cachés en disco en un directorio temporal: no tocar el de la app y empezar en frío
+_TMP = tempfile.mkdtemp(prefix="viaticos_bench_")
+os.environ["VIATICOS_CACHE_DB"] = os.path.join(_TMP, "cache.sqlite3")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+TAMANOS = (1, 1_000, 100_000)
+CIUDADES = ["Monterrey", "Saltillo", "Guadalajara", "Puebla", "Querétaro", "León", "Mérida",
+            "Ciudad de México", "Tijuana", "Chihuahua", "Toluca", "Morelia"]
+
+
+# ------------ Datos -------------
+def viajes_sinteticos(n, semilla=0):
+    azar = np.random.default_rng(semilla)
+    return pd.DataFrame({
+        "dias": azar.integers(1, 10, n),
+        "hospedaje": azar.uniform(600, 2500, n).round(2),
+        "alimentacion": azar.uniform(200, 600, n).round(2),
+        "personas": azar.integers(1, 6, n),
+        "pers_por_hab": azar.integers(1, 3, n),
+        "medio": azar.choice(["Auto", "Avión", "Otro"], n),
+        "ida_vuelta": azar.random(n) < 0.7,
+        "distancia_km": azar.choice([0.0, 250.0, 800.0], n),
+        "casetas": azar.uniform(0, 900, n).round(2),
+        "origen": azar.choice(CIUDADES, n),
+        "destino": azar.choice(CIUDADES, n),
+        "costo_boleto": azar.uniform(1500, 6000, n).round(2),
+        "transporte_otro": azar.uniform(0, 2000, n).round(2),
+        "otros": azar.uniform(0, 500, n).round(2),
+    })
+
+
+def pares_unicos(n, prefijo):
+    return [(f"{prefijo} origen {i}", f"{prefijo} destino {i}") for i in range(n)]
+
+
+# ------------ Medición -------------
+def medir(fn, repeticiones, preparar=None):
+    """Tiempos (s) de `repeticiones` llamadas; `preparar()` corre antes de cada una sin medirse."""
+    tiempos = []
+    for _ in range(repeticiones):
+        arg = preparar() if preparar is not None else None
+        inicio = time.perf_counter()
+        fn(arg) if preparar is not None else fn()
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos
+
+
+def _repeticiones(n, rapido):
+    if n >= 100_000:
+        return 1 if rapido else 3
+    return 5 if rapido else 20
+
+
+# ------------ Casos -------------
+def casos_calculo(tamanos, rapido):
+    from calculos import calcular_viaje, calcular_viaticos
+
+    viaje = viajes_sinteticos(1).iloc[0].to_dict()
+    yield "calculo/viaje", 1, medir(lambda: calcular_viaje(viaje), 200 if rapido else 2000)
+    for n in tamanos:
+        df = viajes_sinteticos(n)
+        yield f"calculo/lote_{n}", n, medir(lambda: calcular_viaticos(df, con_detalle=True), _repeticiones(n, rapido))
+
+
+def casos_lote(tamanos, rapido):
+    from lotes import costear_archivo
+
+    for n in tamanos:
+        csv = viajes_sinteticos(n).to_csv(index=False).encode("utf-8")
+        rutas = []
+
+        def costear():
+            ruta, _ = costear_archivo(io.BytesIO(csv), "viajes.csv")
+            rutas.append(ruta)
+
+        yield f"lote/costear_xlsx_{n}", n, medir(costear, max(1, _repeticiones(n, rapido) // 4))
+        for ruta in rutas:
+            os.remove(ruta)
+
+
+def casos_exportacion(tamanos, rapido):
+    import xlsxwriter
+
+    from calculos import calcular_viaticos, tabla_viaticos
+    from exportar import SHEET_NAME, auto_ajustar_columnas, excel_viaticos, exportar_tabla, pyarrow_disponible
+
+    class _Writer:
+        # Lo mínimo de pd.ExcelWriter que usa auto_ajustar_columnas
+        def __init__(self, ws):
+            self.sheets = {SHEET_NAME: ws}
+
+    for n in tamanos:
+        tabla = tabla_viaticos(calcular_viaticos(viajes_sinteticos(n), con_detalle=True))
+        reps = _repeticiones(n, rapido)
+
+        def autoajuste():
+            wb = xlsxwriter.Workbook(os.path.join(_TMP, "autofit.xlsx"), {"in_memory": True})
+            try:
+                auto_ajustar_columnas(_Writer(wb.add_worksheet(SHEET_NAME)), tabla, SHEET_NAME)
+            finally:
+                wb.close()
+
+        yield f"autofit/{n}", n, medir(autoajuste, reps)
+        # excel_viaticos directo: sin el caché de exportaciones
+        yield f"exportar/xlsx_{n}", n, medir(lambda: excel_viaticos(tabla), max(1, reps // 4))
+        yield f"exportar/csv_{n}", n, medir(lambda: exportar_tabla(tabla, "csv"), reps)
+        if pyarrow_disponible():
+            yield f"exportar/parquet_{n}", n, medir(lambda: exportar_tabla(tabla, "parquet"), reps)
+
+
+def casos_distancia(args):
+    import proveedores
+    from cache_rutas import RouteCache
+    from proveedor_falso import ProveedorFalso
+
+    # Sin límite de tasa ni cortocircuito: se mide el cliente, no la cuota
+    for proveedor in proveedores.RATE_LIMITS:
+        proveedores.RATE_LIMITS[proveedor] = 1e9
+    proveedores._buckets.clear()
+    proveedores.CIRCUITO_UMBRAL = 10 ** 9
+    proveedores._circuitos.clear()
+
+    n = args.pares
+    with ProveedorFalso(latencia=args.latencia, jitter=args.latencia / 2, errores=args.errores) as falso:
+        falso.apuntar(proveedores)
+        corrida = [0]
+
+        def nuevos(prefijo):
+            corrida[0] += 1
+            return pares_unicos(n, f"{prefijo}{corrida[0]}")
+
+        # Cada repetición usa pares nuevos y un caché vacío: todo va a la red
+        yield f"distancia/directions_{n}", n, medir(
+            lambda pares: proveedores.resolver_distancias(pares, "google", "clave", cache=RouteCache(path="")),
+            3, preparar=lambda: nuevos("dir"))
+        yield f"distancia/matrix_{n}", n, medir(
+            lambda pares: proveedores.resolver_distancias_matriz(pares, "clave", cache=RouteCache(path="")),
+            3, preparar=lambda: nuevos("mat"))
+        # ORS: geocodifica cada texto nuevo (2 GET) y luego la ruta (1 POST)
+        yield f"distancia/ors_{n}", n, medir(
+            lambda pares: proveedores.resolver_distancias(pares, "ors", "clave", cache=RouteCache(path="")),
+            3, preparar=lambda: nuevos("ors"))
+        # Caché caliente: mismo par repetido, ninguna llamada a la red
+        cache = RouteCache(path="")
+        cache.set("Monterrey", "Saltillo", "", 85.0)
+        yield "distancia/cache_hit", 1, medir(
+            lambda: proveedores.distancia_cacheada("google", "Monterrey", "Saltillo", "", "clave", cache=cache), 2000)
+        print(f"  proveedor falso: {falso.total_llamadas()} peticiones", file=sys.stderr)
+
+
+def caso_arranque():
+    from arranque import medir as medir_arranque
+
+    r = medir_arranque(os.path.join(RAIZ, "trip_app.py"))
+    yield "arranque/primer_render", 1, [r["primer_render_s"]]
+
+
+# ------------ Resultados -------------
+def resumen(filas, tiempos):
+    return {
+        "filas": filas,
+        "repeticiones": len(tiempos),
+        "mediana_s": statistics.median(tiempos),
+        "min_s": min(tiempos),
+        "max_s": max(tiempos),
+    }
+
+
+def comparar(actual, base, tolerancia):
+    """Lista de (caso, base_s, actual_s, razón) de los casos que empeoraron."""
+    regresiones = []
+    for nombre, r in actual.items():
+        b = base.get(nombre)
+        if not b or not b["min_s"]:
+            continue
+        razon = r["min_s"] / b["min_s"]
+        if razon > 1 + tolerancia:
+            regresiones.append((nombre, b["min_s"], r["min_s"], razon))
+    return regresiones
+
+
+def _tiempo(s):
+    return f"{s * 1e6:,.0f} µs" if s < 1e-3 else f"{s * 1e3:,.1f} ms" if s < 1 else f"{s:,.2f} s"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de la calculadora de viáticos")
+    parser.add_argument("--solo", nargs="*", default=None,
+                        choices=["calculo", "lote", "exportar", "distancia", "arranque"],
+                        help="grupos a correr (default: todos)")
+    parser.add_argument("--tamanos", type=int, nargs="*", default=list(TAMANOS))
+    parser.add_argument("--rapido", action="store_true", help="menos repeticiones")
+    parser.add_argument("--pares", type=int, default=200, help="pares únicos por búsqueda de distancias")
+    parser.add_argument("--latencia", type=float, default=0.05, help="latencia del proveedor falso (s)")
+    parser.add_argument("--errores", type=float, default=0.05, help="fracción de errores 503/429 inyectados")
+    parser.add_argument("--guardar", metavar="JSON", help="guarda los resultados como línea base")
+    parser.add_argument("--comparar", metavar="JSON", help="compara contra una línea base")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="empeoramiento permitido (0.25 = 25 %%)")
+    args = parser.parse_args(argv)
+
+    grupos = {
+        "calculo": lambda: casos_calculo(args.tamanos, args.rapido),
+        "lote": lambda: casos_lote([n for n in args.tamanos if n > 1], args.rapido),
+        "exportar": lambda: casos_exportacion(args.tamanos, args.rapido),
+        "distancia": lambda: casos_distancia(args),
+        "arranque": caso_arranque,
+    }
+    resultados = {}
+    for grupo in args.solo or grupos:
+        print(f"[{grupo}]", file=sys.stderr)
+        for nombre, filas, tiempos in grupos[grupo]():
+            resultados[nombre] = r = resumen(filas, tiempos)
+            print(f"  {nombre:<28} mediana {_tiempo(r['mediana_s']):>10}   min {_tiempo(r['min_s']):>10}"
+                  f"   x{r['repeticiones']}", file=sys.stderr)
+
+    documento = {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "maquina": {"python": platform.python_version(), "plataforma": platform.platform(),
+                    "cpus": os.cpu_count()},
+        "parametros": {"latencia": args.latencia, "errores": args.errores, "pares": args.pares,
+                       "rapido": args.rapido},
+        "resultados": resultados,
+    }
+    if args.guardar:
+        with open(args.guardar, "w", encoding="utf-8") as f:
+            json.dump(documento, f, ensure_ascii=False, indent=2)
+        print(f"Línea base guardada en {args.guardar}", file=sys.stderr)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)["resultados"]
+        regresiones = comparar(resultados, base, args.tolerancia)
+        for nombre, antes, ahora, razon in regresiones:
+            print(f"REGRESIÓN {nombre}: {_tiempo(antes)} -> {_tiempo(ahora)} (x{razon:.2f})")
+        if regresiones:
+            return 1
+        print(f"Sin regresiones (tolerancia {args.tolerancia:.0%}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""
+Servidor HTTP local que imita Google Directions / Distance Matrix y
+OpenRouteService (geocode + directions), con latencia y errores inyectables.
+Las distancias son deterministas (dependen sólo de los textos), así que dos
+corridas con la misma semilla hacen el mismo trabajo.
+
+Uso suelto, para apuntar la página o el servicio a él:
+
+    python benchmarks/proveedor_falso.py --puerto 8765 --latencia 0.05 --errores 0.1
+
+e imprime las variables VIATICOS_*_URL a exportar.
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Límites reales de Distance Matrix por petición
+MATRIX_MAX_ORIGENES = 25
+MATRIX_MAX_DESTINOS = 25
+MATRIX_MAX_ELEMENTOS = 100
+
+
+def km_falso(origen, destino):
+    """Distancia determinista entre 5 y 1500 km."""
+    h = zlib.crc32(f"{origen.strip().casefold()}|{destino.strip().casefold()}".encode("utf-8"))
+    return 5 + (h % 149500) / 100.0
+
+
+def coordenadas_falsas(texto):
+    """(lon, lat) determinista dentro de México."""
+    h = zlib.crc32(texto.strip().casefold().encode("utf-8"))
+    return -117.0 + (h % 3000) / 100.0, 14.5 + ((h // 3000) % 1800) / 100.0
+
+
+def _haversine_km(a, b):
+    lon1, lat1, lon2, lat2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0088 * math.asin(math.sqrt(h))
+
+
+class _Servidor(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # El cliente cortó por timeout: esperado cuando se inyecta latencia
+        pass
+
+
+class ProveedorFalso:
+    """
+    `latencia` segundos por petición (± `jitter`), y con probabilidad
+    `errores` responde 503 o 429. `llamadas` cuenta peticiones por ruta.
+    """
+
+    def __init__(self, latencia=0.05, jitter=0.0, errores=0.0, semilla=0, host="127.0.0.1", puerto=0):
+        self.latencia = latencia
+        self.jitter = jitter
+        self.errores = errores
+        self.llamadas = {}
+        self._azar = random.Random(semilla)
+        self._lock = threading.Lock()
+        self._servidor = _Servidor((host, puerto), self._manejador())
+        self._hilo = None
+
+    @property
+    def url(self):
+        host, puerto = self._servidor.server_address[:2]
+        return f"http://{host}:{puerto}"
+
+    def urls(self):
+        """Variables de entorno / atributos de proveedores que apuntan a este servidor."""
+        return {
+            "VIATICOS_GOOGLE_DIRECTIONS_URL": f"{self.url}/maps/api/directions/json",
+            "VIATICOS_GOOGLE_MATRIX_URL": f"{self.url}/maps/api/distancematrix/json",
+            "VIATICOS_ORS_URL": self.url,
+        }
+
+    def apuntar(self, proveedores):
+        """Redirige el módulo `proveedores` ya importado a este servidor."""
+        urls = self.urls()
+        proveedores.GOOGLE_DIRECTIONS_URL = urls["VIATICOS_GOOGLE_DIRECTIONS_URL"]
+        proveedores.GOOGLE_MATRIX_URL = urls["VIATICOS_GOOGLE_MATRIX_URL"]
+        proveedores.ORS_URL = urls["VIATICOS_ORS_URL"]
+
+    def iniciar(self):
+        self._hilo = threading.Thread(target=self._servidor.serve_forever, daemon=True)
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.detener()
+
+    def total_llamadas(self):
+        with self._lock:
+            return sum(self.llamadas.values())
+
+    # ------------ Peticiones -------------
+    def _turno(self, ruta):
+        """Cuenta, espera la latencia y decide si esta petición falla (código HTTP o None)."""
+        with self._lock:
+            self.llamadas[ruta] = self.llamadas.get(ruta, 0) + 1
+            espera = max(0.0, self.latencia + self._azar.uniform(-self.jitter, self.jitter))
+            falla = self._azar.random() < self.errores
+            codigo = self._azar.choice((503, 429)) if falla else None
+        if espera:
+            time.sleep(espera)
+        return codigo
+
+    def _directions(self, q):
+        km = km_falso(q.get("origin", [""])[0], q.get("destination", [""])[0])
+        return {"status": "OK", "routes": [{"legs": [{"distance": {"value": round(km * 1000)}}]}]}
+
+    def _matrix(self, q):
+        origenes = q.get("origins", [""])[0].split("|")
+        destinos = q.get("destinations", [""])[0].split("|")
+        if (len(origenes) > MATRIX_MAX_ORIGENES or len(destinos) > MATRIX_MAX_DESTINOS
+                or len(origenes) * len(destinos) > MATRIX_MAX_ELEMENTOS):
+            return {"status": "MAX_ELEMENTS_EXCEEDED", "rows": []}
+        return {"status": "OK", "rows": [
+            {"elements": [{"status": "OK", "distance": {"value": round(km_falso(o, d) * 1000)}} for d in destinos]}
+            for o in origenes
+        ]}
+
+    def _geocode(self, q):
+        lon, lat = coordenadas_falsas(q.get("text", [""])[0])
+        return {"features": [{"geometry": {"coordinates": [lon, lat]}}]}
+
+    def _ors_directions(self, cuerpo):
+        a, b = cuerpo["coordinates"][:2]
+        return {"routes": [{"summary": {"distance": _haversine_km(a, b) * 1.3 * 1000}}]}
+
+    def _manejador(self):
+        falso = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _enviar(self, codigo, datos):
+                cuerpo = json.dumps(datos).encode("utf-8")
+                self.send_response(codigo)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def _atender(self, rutas, leer_cuerpo):
+                url = urlparse(self.path)
+                fn = rutas.get(url.path)
+                datos = leer_cuerpo()
+                if fn is None:
+                    return self._enviar(404, {"error": "no encontrado"})
+                codigo = falso._turno(url.path)
+                if codigo is not None:
+                    return self._enviar(codigo, {"error": "inyectado"})
+                self._enviar(200, fn(datos if datos is not None else parse_qs(url.query)))
+
+            def do_GET(self):
+                self._atender({
+                    "/maps/api/directions/json": falso._directions,
+                    "/maps/api/distancematrix/json": falso._matrix,
+                    "/geocode/search": falso._geocode,
+                }, lambda: None)
+
+            def do_POST(self):
+                def leer():
+                    largo = int(self.headers.get("Content-Length") or 0)
+                    return json.loads(self.rfile.read(largo) or b"{}")
+                self._atender({"/v2/directions/driving-car": falso._ors_directions}, leer)
+
+        return Manejador
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Proveedor de distancias falso (Google / ORS)")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--latencia", type=float, default=0.05, help="segundos por petición")
+    parser.add_argument("--jitter", type=float, default=0.0, help="± segundos aleatorios sobre la latencia")
+    parser.add_argument("--errores", type=float, default=0.0, help="fracción de peticiones que responden 503/429")
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    falso = ProveedorFalso(args.latencia, args.jitter, args.errores, args.semilla, puerto=args.puerto)
+    for nombre, valor in falso.urls().items():
+        print(f"export {nombre}={valor}")
+    try:
+        falso.iniciar()._hilo.join()
+    except KeyboardInterrupt:
+        falso.detener()
+
+
+if __name__ == "__main__":
+    main()
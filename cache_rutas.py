@@ -0,0 +1,255 @@
+"""
+Caché compartido de distancias por ruta.
+
+Dos niveles:
+- memoria: LRU por proceso (lo comparten todas las sesiones de Streamlit);
+- disco: SQLite, sobrevive reinicios y lo comparten varios procesos.
+
+Las entradas caducan por TTL y ambos niveles se recortan por tamaño.
+"""
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from metricas import get_metricas
+
+# ------------ Config -------------
+# Junto al código, como data/: el mismo archivo sin importar el directorio de arranque
+CACHE_DB_PATH = os.getenv(
+    "VIATICOS_CACHE_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "viaticos.sqlite3"),
+)
+CACHE_TTL = float(os.getenv("VIATICOS_CACHE_TTL", 30 * 24 * 3600))  # 30 días
+CACHE_MAX_MEMORIA = int(os.getenv("VIATICOS_CACHE_MAX_MEMORIA", 4096))
+CACHE_MAX_DISCO = int(os.getenv("VIATICOS_CACHE_MAX_DISCO", 200_000))
+
+# Cada cuántas escrituras se revisa el tamaño del nivel en disco
+_PODA_CADA = 256
+# Los `accedido` de los hits en disco se acumulan y se escriben juntos
+# (sólo ordenan la poda: perder los pendientes al salir no importa)
+_ACCESOS_MAX = 256
+_ACCESOS_INTERVALO_S = 60.0
+
+
+def normalizar_lugar(texto):
+    """'  Querétaro, QRO ' -> 'queretaro, qro' (sin acentos, minúsculas, espacios simples)."""
+    texto = unicodedata.normalize("NFKD", str(texto or ""))
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.casefold().split())
+
+
+def clave_ruta(origen, destino, pais=""):
+    return (normalizar_lugar(origen), normalizar_lugar(destino), normalizar_lugar(pais))
+
+
+class RouteCache:
+    """Caché LRU en memoria respaldado por SQLite, con TTL y tope de tamaño."""
+
+    def __init__(self, path=CACHE_DB_PATH, ttl=CACHE_TTL,
+                 max_memoria=CACHE_MAX_MEMORIA, max_disco=CACHE_MAX_DISCO):
+        self.path = path
+        self.ttl = ttl
+        self.max_memoria = max_memoria
+        self.max_disco = max_disco
+        self._memoria = OrderedDict()  # clave -> (km, guardado_en)
+        # Dos candados: el de memoria nunca espera al disco
+        self._lock = threading.Lock()
+        self._disco_lock = threading.Lock()
+        self._accesos = {}  # clave -> accedido, pendientes de escribir
+        self._accesos_escritos = time.monotonic()
+        self._escrituras = 0
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.misses = 0
+        self.escrituras = 0  # set() de este proceso (el estimador recalibra con ellas)
+        self._conn = self._abrir()
+
+    def _abrir(self):
+        if not self.path:
+            return None
+        try:
+            carpeta = os.path.dirname(self.path)
+            if carpeta:
+                os.makedirs(carpeta, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rutas ("
+                " origen TEXT NOT NULL, destino TEXT NOT NULL, pais TEXT NOT NULL,"
+                " km REAL NOT NULL, guardado REAL NOT NULL, accedido REAL NOT NULL,"
+                " PRIMARY KEY (origen, destino, pais))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS rutas_accedido ON rutas (accedido)")
+            conn.commit()
+            return conn
+        except sqlite3.Error:
+            # Sin disco utilizable seguimos sólo con el nivel en memoria
+            return None
+
+    # ------------ API -------------
+    def get(self, origen, destino, pais=""):
+        """Distancia en km o None si no hay entrada vigente."""
+        clave = clave_ruta(origen, destino, pais)
+        ahora = time.time()
+        with self._lock:
+            entrada = self._memoria.get(clave)
+            if entrada is not None:
+                km, guardado = entrada
+                if ahora - guardado <= self.ttl:
+                    self._memoria.move_to_end(clave)
+                    self.hits_memoria += 1
+                    return km
+                del self._memoria[clave]
+
+        with self._disco_lock:
+            fila = self._leer_disco(clave, ahora)
+        with self._lock:
+            if fila is None:
+                self.misses += 1
+                return None
+            self.hits_disco += 1
+            if clave in self._memoria:
+                # Un set() entró mientras leíamos el disco: su valor es más nuevo
+                return self._memoria[clave][0]
+            km, guardado = fila
+            self._guardar_memoria(clave, km, guardado)
+            return km
+
+    def set(self, origen, destino, pais, km):
+        clave = clave_ruta(origen, destino, pais)
+        ahora = time.time()
+        with self._lock:
+            self._guardar_memoria(clave, float(km), ahora)
+            self.escrituras += 1
+        with self._disco_lock:
+            self._escribir_disco(clave, float(km), ahora)
+
+    def stats(self):
+        with self._lock:
+            hits = self.hits_memoria + self.hits_disco
+            total = hits + self.misses
+            return {
+                "hits_memoria": self.hits_memoria,
+                "hits_disco": self.hits_disco,
+                "misses": self.misses,
+                "escrituras": self.escrituras,
+                "hit_ratio": (hits / total) if total else 0.0,
+                "entradas_memoria": len(self._memoria),
+            }
+
+    def entradas(self):
+        """Lista de (origen, destino, pais, km) vigentes, con claves normalizadas."""
+        limite = time.time() - self.ttl
+        if self._conn is None:
+            with self._lock:
+                return [(*clave, km) for clave, (km, guardado) in self._memoria.items() if guardado >= limite]
+        with self._disco_lock:
+            try:
+                return self._conn.execute(
+                    "SELECT origen, destino, pais, km FROM rutas WHERE guardado >= ?", (limite,)
+                ).fetchall()
+            except sqlite3.Error:
+                return []
+
+    def clear(self):
+        with self._lock:
+            self._memoria.clear()
+        if self._conn is not None:
+            with self._disco_lock:
+                self._accesos.clear()
+                self._conn.execute("DELETE FROM rutas")
+                self._conn.commit()
+
+    # ------------ Internos -------------
+    # _guardar_memoria con self._lock tomado; los de disco con self._disco_lock
+    def _guardar_memoria(self, clave, km, guardado):
+        self._memoria[clave] = (km, guardado)
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.max_memoria:
+            self._memoria.popitem(last=False)
+
+    def _leer_disco(self, clave, ahora):
+        if self._conn is None:
+            return None
+        try:
+            fila = self._conn.execute(
+                "SELECT km, guardado FROM rutas WHERE origen=? AND destino=? AND pais=?", clave
+            ).fetchone()
+            if fila is None:
+                return None
+            if ahora - fila[1] > self.ttl:
+                self._conn.execute("DELETE FROM rutas WHERE origen=? AND destino=? AND pais=?", clave)
+                self._conn.commit()
+                return None
+            self._accesos[clave] = ahora
+            if (len(self._accesos) >= _ACCESOS_MAX
+                    or time.monotonic() - self._accesos_escritos >= _ACCESOS_INTERVALO_S):
+                self._escribir_accesos()
+                self._conn.commit()
+            return fila
+        except sqlite3.Error:
+            return None
+
+    def _escribir_disco(self, clave, km, ahora):
+        if self._conn is None:
+            return
+        try:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO rutas (origen, destino, pais, km, guardado, accedido)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (*clave, km, ahora, ahora),
+            )
+            self._escrituras += 1
+            if self._escrituras % _PODA_CADA == 0:
+                self._podar_disco(ahora)
+            self._conn.commit()
+        except sqlite3.Error:
+            pass
+
+    def _escribir_accesos(self):
+        # Sin commit: lo hace quien llama
+        if self._accesos:
+            self._conn.executemany(
+                "UPDATE rutas SET accedido=? WHERE origen=? AND destino=? AND pais=?",
+                [(accedido, *clave) for clave, accedido in self._accesos.items()],
+            )
+            self._accesos.clear()
+        self._accesos_escritos = time.monotonic()
+
+    def _podar_disco(self, ahora):
+        self._escribir_accesos()
+        self._conn.execute("DELETE FROM rutas WHERE guardado < ?", (ahora - self.ttl,))
+        (n,) = self._conn.execute("SELECT COUNT(*) FROM rutas").fetchone()
+        exceso = n - self.max_disco
+        if exceso > 0:
+            self._conn.execute(
+                "DELETE FROM rutas WHERE rowid IN (SELECT rowid FROM rutas ORDER BY accedido LIMIT ?)",
+                (exceso,),
+            )
+
+
+_route_cache = None
+_route_cache_lock = threading.Lock()
+
+
+def get_route_cache():
+    """Instancia única por proceso (los módulos importados persisten entre reruns y sesiones)."""
+    global _route_cache
+    if _route_cache is None:
+        with _route_cache_lock:
+            if _route_cache is None:
+                _route_cache = RouteCache()
+    return _route_cache
+
+
+def _metricas_cache_rutas():
+    if _route_cache is None:
+        return []
+    stats = _route_cache.stats()
+    return [({"dato": k}, v) for k, v in stats.items()]
+
+
+get_metricas().gauge("cache_rutas", _metricas_cache_rutas, "Caché de rutas (memoria + SQLite)")
@@ -0,0 +1,289 @@
+"""
+Motor de cálculo de viáticos.
+
+Trabaja sobre un DataFrame con un viaje por fila (mismo esquema que DEFAULTS)
+y calcula todas las columnas derivadas con operaciones vectorizadas de
+NumPy/pandas, sin ciclos por fila. La página de Streamlit usa el mismo motor
+para su único viaje.
+"""
+import numpy as np
+
+from cache_rutas import normalizar_lugar
+from metricas import medido
+from perezoso import lazy_import
+
+pd = lazy_import("pandas")
+
+DEFAULTS = {
+    "dias": 1,
+    "hospedaje": 0.0,
+    "alimentacion": 0.0,
+    "personas": 1,
+    "pers_por_hab": 1,
+    "medio": "Auto",
+    "ida_vuelta": True,
+    "precio_gas": 25.0,
+    "km_litro": 12.0,
+    "distancia_km": 0.0,
+    "casetas": 0.0,
+    "pais": "Mexico",
+    "origen": "",
+    "destino": "",
+    "otros": 0.0,
+    "costo_boleto": 0.0,
+    "transporte_otro": 0.0
+}
+
+MEDIOS = ["Auto", "Avión", "Otro"]
+# "auto", "AVION " -> nombre canónico de MEDIOS
+_MEDIOS_NORMALIZADOS = {normalizar_lugar(m): m for m in MEDIOS}
+
+_ENTEROS = ["dias", "personas", "pers_por_hab"]
+_REALES = ["hospedaje", "alimentacion", "precio_gas", "km_litro", "distancia_km",
+           "casetas", "otros", "costo_boleto", "transporte_otro"]
+_TEXTOS = ["medio", "pais", "origen", "destino"]
+
+# Magnitud máxima aceptada: más allá es un error de captura (y no cabe en int64 / JSON)
+_MAX_ENTERO = 1_000_000
+_MAX_REAL = 1e12
+
+_VERDADEROS = {"true", "1", "si", "sí", "s", "yes", "y", "x", "verdadero"}
+
+# Columnas del Excel "Viaticos" -> columna del resultado
+COLUMNAS_EXCEL = {
+    "Días de viaje": "dias",
+    "Personas": "personas",
+    "Personas por habitación": "pers_por_hab",
+    "Habitaciones (calc)": "rooms",
+    "Hospedaje por día (hab)": "hospedaje",
+    "Alimentación por día (persona)": "alimentacion",
+    "Hotel total": "hotel_total",
+    "Comidas total": "alimentos_total",
+    "Medio transporte": "medio",
+    "Detalle transporte": "detalle_transporte",
+    "Transporte total": "transporte_total",
+    "Otros": "otros_total",
+    "TOTAL VIÁTICOS": "total_viaticos",
+}
+NOTA_ESTIMADA = " (distancia aproximada)"
+_REDONDEAR = ["hotel_total", "alimentos_total", "transporte_total", "otros_total", "total_viaticos"]
+
+
+def normalizar_viajes(viajes):
+    """Completa columnas faltantes con DEFAULTS y fuerza los tipos del esquema."""
+    df = pd.DataFrame(viajes).copy()
+    for col, default in DEFAULTS.items():
+        if col not in df.columns:
+            df[col] = default
+    for col in _ENTEROS:
+        df[col] = _columna_numerica(df[col], col, _MAX_ENTERO).astype(np.int64)
+    for col in _REALES:
+        df[col] = _columna_numerica(df[col], col, _MAX_REAL)
+    for col in _TEXTOS:
+        df[col] = df[col].fillna(DEFAULTS[col]).astype(str)
+    medios = {m: normalizar_medio(m) for m in df["medio"].unique()}
+    df["medio"] = df["medio"].map(medios)
+    if df["ida_vuelta"].dtype != bool:
+        iv = df["ida_vuelta"]
+        # 1/0 (también 1.0 de una columna numérica con celdas vacías) antes que el texto
+        numero = pd.to_numeric(iv, errors="coerce")
+        texto = iv.astype(str).str.strip().str.casefold()
+        df["ida_vuelta"] = np.where(
+            iv.isna(), DEFAULTS["ida_vuelta"], np.where(numero.notna(), numero != 0, texto.isin(_VERDADEROS))
+        )
+    return df
+
+
+def _columna_numerica(serie, col, tope):
+    # Sólo lo vacío toma el default; texto no numérico, inf o fuera de rango es un error
+    if not pd.api.types.is_numeric_dtype(serie):
+        serie = serie.mask(serie.astype(str).str.strip() == "")
+    numero = pd.to_numeric(serie, errors="coerce").astype(np.float64)
+    invalidos = (serie.notna() & numero.isna()) | (numero.notna() & ~(numero.abs() <= tope))
+    if invalidos.any():
+        raise ValueError(f"{col} inválido: {str(serie[invalidos].iloc[0])!r} (número hasta {tope:g})")
+    return numero.fillna(DEFAULTS[col])
+
+
+def normalizar_medio(texto):
+    """'auto', ' AVION' -> nombre de MEDIOS; vacío -> el default. ValueError si no es ninguno."""
+    clave = normalizar_lugar(texto)
+    if not clave:
+        return DEFAULTS["medio"]
+    medio = _MEDIOS_NORMALIZADOS.get(clave)
+    if medio is None:
+        raise ValueError(f"Medio de transporte no válido: {texto!r} (use {', '.join(MEDIOS)})")
+    return medio
+
+
+def _es_nulo(valor):
+    return valor is None or (isinstance(valor, float) and np.isnan(valor))
+
+
+def _ida_vuelta(valor):
+    # Igual que en normalizar_viajes: número (distinto de 0) y luego texto
+    if isinstance(valor, (bool, np.bool_)):
+        return bool(valor)
+    if _es_nulo(valor):
+        return DEFAULTS["ida_vuelta"]
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        numero = np.nan
+    if not np.isnan(numero):
+        return numero != 0
+    return str(valor).strip().casefold() in _VERDADEROS
+
+
+def _numero(valor, col, tope):
+    # Como _columna_numerica para un escalar
+    if _es_nulo(valor) or (isinstance(valor, str) and not valor.strip()):
+        return DEFAULTS[col]
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        numero = np.nan
+    if not abs(numero) <= tope:
+        raise ValueError(f"{col} inválido: {str(valor)!r} (número hasta {tope:g})")
+    return numero
+
+
+def normalizar_viaje(valores):
+    """Versión de normalizar_viajes para un solo viaje (dict), sin pandas: mismos defaults y coerciones."""
+    fila = {k: valores.get(k, v) for k, v in DEFAULTS.items()}
+    for col in _ENTEROS:
+        fila[col] = int(_numero(fila[col], col, _MAX_ENTERO))
+    for col in _REALES:
+        fila[col] = _numero(fila[col], col, _MAX_REAL)
+    for col in _TEXTOS:
+        valor = fila[col]
+        fila[col] = DEFAULTS[col] if _es_nulo(valor) else str(valor)
+    fila["medio"] = normalizar_medio(fila["medio"])
+    fila["ida_vuelta"] = _ida_vuelta(fila["ida_vuelta"])
+    return fila
+
+
+def _columnas_derivadas(c):
+    """Columnas calculadas a partir de arreglos de NumPy del esquema DEFAULTS (mismo largo)."""
+    personas = c["personas"]
+    pers_por_hab = c["pers_por_hab"]
+    es_auto = c["medio"] == "Auto"
+    es_avion = c["medio"] == "Avión"
+
+    factor = np.where(c["ida_vuelta"], 2, 1)
+
+    # Transporte: Auto
+    km_litro = c["km_litro"]
+    km_totales = np.where(es_auto, c["distancia_km"] * factor, 0.0)
+    casetas_totales = np.where(es_auto, c["casetas"] * factor, 0.0)
+    litros = np.divide(km_totales, km_litro, out=np.zeros(len(km_litro)), where=km_litro > 0)
+    gasolina = litros * c["precio_gas"]
+
+    # Transporte: Avión / Otro
+    boletos = c["costo_boleto"] * personas * factor
+    transporte_total = np.select(
+        [es_auto, es_avion],
+        [gasolina + casetas_totales, boletos],
+        default=c["transporte_otro"],
+    )
+
+    # Hospedaje y alimentos
+    rooms = np.where(
+        pers_por_hab > 0,
+        -(-personas // np.where(pers_por_hab > 0, pers_por_hab, 1)),  # ceil entero
+        personas,
+    )
+    hotel_dia = c["hospedaje"] * rooms
+    alimentos_dia = c["alimentacion"] * personas
+    hotel_total = c["dias"] * hotel_dia
+    alimentos_total = c["dias"] * alimentos_dia
+    otros_total = c["otros"]
+
+    return {
+        "factor": factor,
+        "km_totales": km_totales,
+        "casetas_totales": casetas_totales,
+        "litros": litros,
+        "gasolina": gasolina,
+        "transporte_total": transporte_total,
+        "rooms": rooms,
+        "hotel_dia": hotel_dia,
+        "alimentos_dia": alimentos_dia,
+        "hotel_total": hotel_total,
+        "alimentos_total": alimentos_total,
+        "otros_total": otros_total,
+        "total_viaticos": hotel_total + alimentos_total + transporte_total + otros_total,
+    }
+
+
+@medido("calculo", funcion="calcular_viaticos")
+def calcular_viaticos(viajes, con_detalle=False):
+    """
+    Calcula rooms, hotel_total, alimentos_total, litros, gasolina,
+    casetas_totales, transporte_total y total_viaticos para N viajes.
+    Devuelve un DataFrame nuevo con las columnas de entrada más las derivadas.
+    """
+    df = normalizar_viajes(viajes)
+    for col, valores in _columnas_derivadas({k: df[k].to_numpy() for k in DEFAULTS}).items():
+        df[col] = valores
+    if con_detalle:
+        df["detalle_transporte"] = detalle_transporte(df)
+    return df
+
+
+def detalle_transporte(res):
+    """Texto 'Detalle transporte' por fila, igual al que arma la página."""
+    fmt0 = "{:.0f}".format
+    fmt1 = "{:.1f}".format
+    fmt2 = "{:.2f}".format
+    auto = ("Auto: " + res["km_totales"].map(fmt0) + " km, " + res["litros"].map(fmt1)
+            + " L x $" + res["precio_gas"].map(fmt2) + " + casetas $" + res["casetas_totales"].map(fmt2))
+    avion = ("Avión: $" + res["costo_boleto"].map(fmt2) + " x " + res["personas"].astype(str)
+             + " persona(s) x " + res["factor"].astype(str) + " vía(s)")
+    return pd.Series(
+        np.select([res["medio"] == "Auto", res["medio"] == "Avión"], [auto, avion], default="Otro"),
+        index=res.index,
+    )
+
+
+def tabla_viaticos(res):
+    """DataFrame con el layout de la hoja 'Viaticos' a partir de un resultado de calcular_viaticos."""
+    if "detalle_transporte" not in res.columns:
+        res = res.assign(detalle_transporte=detalle_transporte(res))
+    tabla = res[list(COLUMNAS_EXCEL.values())].copy()
+    tabla[_REDONDEAR] = tabla[_REDONDEAR].round(2)
+    if "distancia_estimada" in res.columns:
+        # Distancias del estimador local (lotes.completar_distancias): que no pasen por reales
+        estimada = res["distancia_estimada"].fillna(False).astype(bool)
+        tabla.loc[estimada, "detalle_transporte"] = tabla.loc[estimada, "detalle_transporte"] + NOTA_ESTIMADA
+    tabla.columns = list(COLUMNAS_EXCEL.keys())
+    return tabla
+
+
+def _detalle_viaje(r):
+    if r["medio"] == "Auto":
+        return (f"Auto: {r['km_totales']:.0f} km, {r['litros']:.1f} L x ${r['precio_gas']:.2f}"
+                f" + casetas ${r['casetas_totales']:.2f}")
+    if r["medio"] == "Avión":
+        return f"Avión: ${r['costo_boleto']:.2f} x {r['personas']} persona(s) x {r['factor']} vía(s)"
+    return "Otro"
+
+
+@medido("calculo", funcion="calcular_viaje")
+def calcular_viaje(valores):
+    """
+    Un solo viaje (p. ej. st.session_state) -> dict con entradas y columnas
+    calculadas. Usa el mismo núcleo vectorizado con arreglos de largo 1 y no
+    necesita pandas (la página no lo importa hasta exportar).
+    """
+    fila = normalizar_viaje(valores)
+    columnas = {k: np.array([v]) for k, v in fila.items()}
+    resultado = dict(fila)
+    resultado.update({k: v[0].item() for k, v in _columnas_derivadas(columnas).items()})
+    resultado["detalle_transporte"] = _detalle_viaje(resultado)
+    return resultado
+
+
+def tabla_viaje(resultado):
+    """Hoja 'Viaticos' de un solo viaje calculado con calcular_viaje."""
+    return tabla_viaticos(pd.DataFrame([resultado]))
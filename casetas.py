@@ -0,0 +1,151 @@
+"""
+Tabla de casetas (peaje) para llenar `casetas` sin captura manual.
+
+Dos fuentes en data/ (VIATICOS_CASETAS_RUTAS / VIATICOS_CASETAS_PLAZAS):
+- casetas_rutas.csv (origen, destino, costo): costo una vía en auto por ruta;
+  vale en ambos sentidos salvo que la ruta inversa tenga su propia fila.
+- casetas_plazas.csv (plaza, costo): costo en auto por plaza de cobro. Un
+  viaje que trae la columna `plazas` ("Plaza A|Plaza B") paga la suma.
+
+Orden de búsqueda: la secuencia de plazas del viaje, la matriz precalculada
+de sucursales (matriz_rutas, que toma sus casetas de esta tabla al
+construirse: al cambiar tarifas hay que reconstruirla) y la tabla por ruta.
+
+Se cargan una vez por proceso; los nombres se comparan normalizados, igual
+que en el caché de rutas. Los archivos del repositorio son plantillas sin
+datos: las tarifas las publica cada concesionaria (CAPUFE y privadas) y
+cambian al menos una vez al año, así que hay que cargarlas aquí.
+"""
+import csv
+import os
+import threading
+
+import numpy as np
+
+from cache_rutas import normalizar_lugar
+from matriz_rutas import get_matriz_rutas
+
+_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+CASETAS_RUTAS_CSV = os.getenv("VIATICOS_CASETAS_RUTAS", os.path.join(_DATA, "casetas_rutas.csv"))
+CASETAS_PLAZAS_CSV = os.getenv("VIATICOS_CASETAS_PLAZAS", os.path.join(_DATA, "casetas_plazas.csv"))
+SEPARADOR_PLAZAS = "|"
+
+
+def _costo(texto):
+    try:
+        costo = float(str(texto).replace("$", "").replace(",", "").strip())
+    except ValueError:
+        return None
+    return costo if costo >= 0 else None
+
+
+class TablaCasetas:
+    """Índices (origen, destino) -> costo y plaza -> costo."""
+
+    def __init__(self, rutas_csv=CASETAS_RUTAS_CSV, plazas_csv=CASETAS_PLAZAS_CSV):
+        self._plazas = {}
+        self._rutas = {}
+        if plazas_csv and os.path.exists(plazas_csv):
+            for fila in self._filas(plazas_csv):
+                costo = _costo(fila.get("costo", ""))
+                plaza = normalizar_lugar(fila.get("plaza"))
+                if plaza and costo is not None:
+                    self._plazas[plaza] = costo
+        if rutas_csv and os.path.exists(rutas_csv):
+            inversas = {}
+            for fila in self._filas(rutas_csv):
+                costo = _costo(fila.get("costo", ""))
+                o, d = normalizar_lugar(fila.get("origen")), normalizar_lugar(fila.get("destino"))
+                if o and d and costo is not None:
+                    self._rutas[(o, d)] = costo
+                    inversas.setdefault((d, o), costo)
+            for clave, costo in inversas.items():
+                self._rutas.setdefault(clave, costo)
+
+    @staticmethod
+    def _filas(path):
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            yield from csv.DictReader(f)
+
+    def __len__(self):
+        return len(self._rutas) + len(self._plazas)
+
+    def por_ruta(self, origen, destino):
+        """Costo una vía de la ruta o None."""
+        return self._rutas.get((normalizar_lugar(origen), normalizar_lugar(destino)))
+
+    def por_plazas(self, plazas):
+        """Suma de la secuencia "A|B|C"; None si viene vacía o alguna plaza no está en la tabla."""
+        nombres = [normalizar_lugar(p) for p in str(plazas or "").split(SEPARADOR_PLAZAS)]
+        nombres = [p for p in nombres if p]
+        if not nombres or any(p not in self._plazas for p in nombres):
+            return None
+        return sum(self._plazas[p] for p in nombres)
+
+    def por_ruta_lote(self, origenes, destinos):
+        """Arreglo de costos alineado con las entradas (NaN sin dato). Cada par distinto se busca una vez."""
+        origenes = np.asarray(origenes, dtype=object).astype(str)
+        destinos = np.asarray(destinos, dtype=object).astype(str)
+        if not self._rutas or not len(origenes):
+            return np.full(len(origenes), np.nan)
+        # Códigos por nombre y luego por par: sólo se buscan los pares distintos
+        uo, io = np.unique(origenes, return_inverse=True)
+        ud, id_ = np.unique(destinos, return_inverse=True)
+        pares, inversa = np.unique(io.reshape(-1) * len(ud) + id_.reshape(-1), return_inverse=True)
+        costos = np.array([self.por_ruta(uo[p // len(ud)], ud[p % len(ud)]) for p in pares], dtype=float)
+        return costos[inversa.reshape(-1)]
+
+    def por_plazas_lote(self, secuencias):
+        secuencias = np.asarray(secuencias, dtype=object).astype(str)
+        if not self._plazas or not len(secuencias):
+            return np.full(len(secuencias), np.nan)
+        unicas, inversa = np.unique(secuencias, return_inverse=True)
+        costos = np.array([self.por_plazas(s) for s in unicas], dtype=float)
+        return costos[inversa.reshape(-1)]
+
+
+_tabla = None
+_tabla_lock = threading.Lock()
+
+
+def get_tabla_casetas():
+    """Instancia única por proceso."""
+    global _tabla
+    if _tabla is None:
+        with _tabla_lock:
+            if _tabla is None:
+                _tabla = TablaCasetas()
+    return _tabla
+
+
+# ------------ Búsqueda -------------
+def buscar_casetas(origen, destino, pais="", plazas=""):
+    """Costo una vía del viaje o None si no hay dato."""
+    tabla = get_tabla_casetas()
+    costo = tabla.por_plazas(plazas) if plazas else None
+    if costo is None:
+        matriz = get_matriz_rutas()
+        if matriz is not None and matriz.aplica(pais):
+            costo = matriz.casetas(origen, destino)
+    if costo is None:
+        costo = tabla.por_ruta(origen, destino)
+    return costo
+
+
+def casetas_lote(origenes, destinos, paises, plazas=None):
+    """Versión vectorizada de buscar_casetas: arreglo alineado con las entradas, NaN sin dato."""
+    tabla = get_tabla_casetas()
+    origenes = np.asarray(origenes, dtype=object)
+    destinos = np.asarray(destinos, dtype=object)
+    costo = tabla.por_plazas_lote(plazas) if plazas is not None else np.full(len(origenes), np.nan)
+    matriz = get_matriz_rutas()
+    falta = np.isnan(costo)
+    if matriz is not None and falta.any():
+        paises = np.asarray(paises, dtype=object).astype(str)
+        aplica = {p: matriz.aplica(p) for p in np.unique(paises[falta])}
+        falta &= np.array([aplica.get(p, False) for p in paises])
+        costo[falta] = matriz.casetas_lote(origenes[falta], destinos[falta])
+    falta = np.isnan(costo)
+    if falta.any():
+        costo[falta] = tabla.por_ruta_lote(origenes[falta], destinos[falta])
+    return costo
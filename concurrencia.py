@@ -0,0 +1,199 @@
+"""
+Primitivas de concurrencia compartidas por los proveedores de distancia.
+"""
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+
+class TokenBucket:
+    """Limitador de tasa: `rate` tokens por segundo, ráfagas de hasta `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1.0):
+        """Bloquea hasta disponer de `tokens`."""
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (ahora - self._ultimo) * self.rate)
+                self._ultimo = ahora
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                espera = (tokens - self._tokens) / self.rate
+            time.sleep(espera)
+
+
+def con_reintentos(fn, reintentar=(Exception,), intentos=4, base=0.5, tope=8.0):
+    """
+    Ejecuta `fn()` y reintenta ante las excepciones de `reintentar` con backoff
+    exponencial y jitter completo (espera aleatoria en [0, min(tope, base * 2**n)]).
+    """
+    for n in range(intentos):
+        try:
+            return fn()
+        except reintentar:
+            if n == intentos - 1:
+                raise
+            time.sleep(random.uniform(0, min(tope, base * 2 ** n)))
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes con la misma clave: la primera ejecuta `fn`
+    y las demás esperan el mismo Future (mismo resultado o misma excepción).
+    """
+
+    def __init__(self):
+        self._en_vuelo = {}
+        self._lock = threading.Lock()
+
+    def do(self, clave, fn):
+        with self._lock:
+            futuro = self._en_vuelo.get(clave)
+            lider = futuro is None
+            if lider:
+                futuro = Future()
+                self._en_vuelo[clave] = futuro
+        if not lider:
+            return futuro.result()
+        try:
+            resultado = fn()
+        except BaseException as e:
+            futuro.set_exception(e)
+            raise
+        else:
+            futuro.set_result(resultado)
+            return resultado
+        finally:
+            with self._lock:
+                del self._en_vuelo[clave]
+
+
+class Debouncer:
+    """
+    Retrasa `fn` `espera` segundos por clave: otra llamada con la misma clave
+    antes de que venza reemplaza a la pendiente. `fn` corre en el hilo del
+    temporizador.
+    """
+
+    def __init__(self, espera):
+        self.espera = float(espera)
+        self._pendientes = {}
+        self._lock = threading.Lock()
+
+    def llamar(self, clave, fn):
+        def disparar():
+            with self._lock:
+                if self._pendientes.get(clave) is not temporizador:
+                    return
+                del self._pendientes[clave]
+            fn()
+
+        temporizador = threading.Timer(self.espera, disparar)
+        temporizador.daemon = True
+        with self._lock:
+            anterior = self._pendientes.get(clave)
+            if anterior is not None:
+                anterior.cancel()
+            self._pendientes[clave] = temporizador
+        temporizador.start()
+
+    def cancelar(self, clave):
+        with self._lock:
+            temporizador = self._pendientes.pop(clave, None)
+        if temporizador is not None:
+            temporizador.cancel()
+
+
+class CircuitoAbierto(Exception):
+    """El circuito del proveedor está abierto: se rechaza sin llamar a la red."""
+
+
+class CircuitBreaker:
+    """
+    Cortocircuito por proveedor, compartido por todas las sesiones del proceso.
+
+    Cerrado: las llamadas pasan; `umbral` fallas seguidas lo abren. Abierto:
+    se rechaza de inmediato con CircuitoAbierto durante `espera` segundos.
+    Semiabierto: pasado ese tiempo se deja pasar una sola llamada de prueba;
+    si sale bien se cierra, si falla vuelve a abrirse.
+    """
+
+    CERRADO = "cerrado"
+    ABIERTO = "abierto"
+    SEMIABIERTO = "semiabierto"
+
+    def __init__(self, umbral=5, espera=30.0):
+        self.umbral = umbral
+        self.espera = espera
+        self._estado = self.CERRADO
+        self._fallas = 0
+        self._abierto_desde = 0.0
+        self._sonda_en_curso = False
+        self._lock = threading.Lock()
+        self.rechazadas = 0
+
+    def estado(self):
+        with self._lock:
+            if self._estado == self.ABIERTO and time.monotonic() - self._abierto_desde >= self.espera:
+                return self.SEMIABIERTO
+            return self._estado
+
+    def permitir(self):
+        """True si la llamada puede ir a la red (en semiabierto, sólo la sonda)."""
+        with self._lock:
+            if self._estado == self.CERRADO:
+                return True
+            if self._estado == self.ABIERTO and time.monotonic() - self._abierto_desde >= self.espera:
+                self._estado = self.SEMIABIERTO
+            if self._estado == self.SEMIABIERTO and not self._sonda_en_curso:
+                self._sonda_en_curso = True
+                return True
+            self.rechazadas += 1
+            return False
+
+    def exito(self):
+        with self._lock:
+            self._estado = self.CERRADO
+            self._fallas = 0
+            self._sonda_en_curso = False
+
+    def falla(self):
+        with self._lock:
+            self._fallas += 1
+            if self._estado == self.SEMIABIERTO or self._fallas >= self.umbral:
+                self._estado = self.ABIERTO
+                self._abierto_desde = time.monotonic()
+            self._sonda_en_curso = False
+
+    def llamar(self, fn, cuenta_como_falla=lambda e: True):
+        """
+        Ejecuta `fn()` a través del circuito. Las excepciones para las que
+        `cuenta_como_falla(e)` es False (p. ej. una API key inválida) no lo
+        abren, pero igual se propagan.
+        """
+        if not self.permitir():
+            raise CircuitoAbierto()
+        try:
+            resultado = fn()
+        except Exception as e:
+            # El proveedor respondió aunque sea con un error definitivo: está vivo
+            if cuenta_como_falla(e):
+                self.falla()
+            else:
+                self.exito()
+            raise
+        except BaseException:
+            with self._lock:
+                self._sonda_en_curso = False
+            raise
+        self.exito()
+        return resultado
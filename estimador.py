@@ -0,0 +1,124 @@
+"""
+Estimador local de distancia por carretera.
+
+Distancia de gran círculo (haversine) entre las coordenadas del gazetteer
+multiplicada por un factor de circuito (carretera / línea recta) calibrado
+con las respuestas reales guardadas en el caché de rutas. No usa la red: es
+el respaldo instantáneo cuando no hay API key o el proveedor falla, y
+siempre debe mostrarse como aproximado.
+
+El factor se recalibra en un hilo aparte (recorrer el caché puede tomar
+segundos) cada FACTOR_REVISION_S o tras FACTOR_ESCRITURAS rutas nuevas; las
+estimaciones nunca lo esperan y usan el último calibrado (o el default).
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+from cache_rutas import get_route_cache
+from geocodificacion import get_gazetteer
+
+RADIO_TIERRA_KM = 6371.0088
+FACTOR_CIRCUITO_DEFAULT = 1.3
+FACTOR_MIN, FACTOR_MAX = 1.0, 2.5
+FACTOR_REVISION_S = float(os.getenv("VIATICOS_FACTOR_REVISION_S", 3600))
+FACTOR_ESCRITURAS = int(os.getenv("VIATICOS_FACTOR_ESCRITURAS", 200))
+# Por debajo de esta distancia en línea recta el factor es poco confiable
+_MIN_KM_CALIBRACION = 20.0
+
+_factor = FACTOR_CIRCUITO_DEFAULT
+_calibrado_en = None          # time.monotonic() de la última calibración
+_escrituras_calibradas = 0    # RouteCache.escrituras en esa calibración
+_calibrando = False
+_factor_lock = threading.Lock()
+
+
+def haversine_km(lon1, lat1, lon2, lat2):
+    """Distancia de gran círculo en km; acepta escalares o arreglos de NumPy."""
+    lon1, lat1, lon2, lat2 = (np.radians(np.asarray(x, dtype=float)) for x in (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(a))
+
+
+def calibrar_factor(cache=None, gazetteer=None):
+    """
+    Mediana de km_api / km_linea_recta sobre las rutas del caché cuyas dos
+    ciudades están en el gazetteer. Sin datos suficientes devuelve el default.
+    """
+    cache = cache if cache is not None else get_route_cache()
+    gazetteer = gazetteer if gazetteer is not None else get_gazetteer()
+    o_coords, d_coords, km_api = [], [], []
+    for origen, destino, _, km in cache.entradas():
+        o = gazetteer.buscar(origen)
+        d = gazetteer.buscar(destino)
+        if o is not None and d is not None:
+            o_coords.append(o)
+            d_coords.append(d)
+            km_api.append(km)
+    if not km_api:
+        return FACTOR_CIRCUITO_DEFAULT
+    o_coords, d_coords = np.array(o_coords), np.array(d_coords)
+    recta = haversine_km(o_coords[:, 0], o_coords[:, 1], d_coords[:, 0], d_coords[:, 1])
+    validos = recta >= _MIN_KM_CALIBRACION
+    if validos.sum() < 3:
+        return FACTOR_CIRCUITO_DEFAULT
+    factor = float(np.median(np.asarray(km_api)[validos] / recta[validos]))
+    return float(np.clip(factor, FACTOR_MIN, FACTOR_MAX))
+
+
+def _factor_vencido():
+    if _calibrado_en is None or time.monotonic() - _calibrado_en >= FACTOR_REVISION_S:
+        return True
+    return get_route_cache().escrituras - _escrituras_calibradas >= FACTOR_ESCRITURAS
+
+
+def _recalibrar():
+    global _factor, _calibrado_en, _escrituras_calibradas, _calibrando
+    escrituras = get_route_cache().escrituras
+    try:
+        _factor = calibrar_factor()
+    finally:
+        with _factor_lock:
+            _calibrado_en = time.monotonic()
+            _escrituras_calibradas = escrituras
+            _calibrando = False
+
+
+def factor_circuito():
+    """Factor vigente; si está vencido lanza la recalibración en segundo plano sin esperarla."""
+    global _calibrando
+    if _factor_vencido():
+        with _factor_lock:
+            lanzar = not _calibrando
+            _calibrando = True
+        if lanzar:
+            threading.Thread(target=_recalibrar, name="calibrar-factor", daemon=True).start()
+    return _factor
+
+
+def estimar_km(origen, destino):
+    """Distancia aproximada por carretera (una vía) o None si alguna ciudad no está en el gazetteer."""
+    gazetteer = get_gazetteer()
+    o = gazetteer.buscar(origen)
+    d = gazetteer.buscar(destino)
+    if o is None or d is None:
+        return None
+    return float(haversine_km(o[0], o[1], d[0], d[1])) * factor_circuito()
+
+
+def estimar_km_lote(origenes, destinos):
+    """
+    Versión vectorizada: arreglo de km aproximados alineado con las entradas
+    (NaN donde falta alguna ciudad). Cada nombre distinto se busca una vez.
+    """
+    gazetteer = get_gazetteer()
+    origenes = np.asarray(origenes, dtype=object)
+    destinos = np.asarray(destinos, dtype=object)
+    nombres, inversa = np.unique(np.concatenate([origenes, destinos]).astype(str), return_inverse=True)
+    coords = np.array([gazetteer.buscar(n) or (np.nan, np.nan) for n in nombres], dtype=float).reshape(-1, 2)
+    n = len(origenes)
+    o = coords[inversa[:n]]
+    d = coords[inversa[n:]]
+    return haversine_km(o[:, 0], o[:, 1], d[:, 0], d[:, 1]) * factor_circuito()
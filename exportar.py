@@ -0,0 +1,354 @@
+"""
+Exportación a Excel de la hoja "Viaticos".
+
+Los libros terminados se guardan en un caché de bytes compartido por todas
+las sesiones, acotado por tamaño total y direccionado por el hash del
+contenido de la tabla: dos exportaciones con los mismos datos devuelven los
+mismos bytes sin volver a generar el archivo.
+"""
+import hashlib
+import importlib.util
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import numpy as np
+
+from metricas import BUCKETS_BYTES, get_metricas, medido, observar, span
+from perezoso import lazy_import
+
+pd = lazy_import("pandas")
+
+SHEET_NAME = "Viaticos"
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("VIATICOS_EXPORT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Auto-ajuste: filas que se miden por columna y ancho máximo
+AUTOFIT_MUESTRA = 2000
+AUTOFIT_TOPE = 60
+
+
+def _max_len(serie):
+    """Longitud máxima como texto, vectorizada (str.len sobre la serie)."""
+    if serie.empty:
+        return 0
+    return int(serie.astype(str).str.len().max())
+
+
+def _muestra(df, n):
+    """Filas para medir: todas si son pocas; si no, las primeras y una muestra uniforme del resto."""
+    if len(df) <= n:
+        return df
+    mitad = n // 2
+    idx = np.unique(np.concatenate([
+        np.arange(mitad),
+        np.linspace(mitad, len(df) - 1, n - mitad).astype(np.int64),
+    ]))
+    return df.iloc[idx]
+
+
+def anchos_columnas(df, muestra=AUTOFIT_MUESTRA, tope=AUTOFIT_TOPE):
+    """Ancho (caracteres + margen, con tope) por columna; costo acotado por `muestra` filas."""
+    filas = _muestra(df, muestra)
+    return [min(max(len(str(col)), _max_len(filas[col])) + 2, tope) for col in df.columns]
+
+
+def ajustar_columnas(ws, df, muestra=AUTOFIT_MUESTRA):
+    for idx, ancho in enumerate(anchos_columnas(df, muestra)):
+        ws.set_column(idx, idx, ancho)
+
+
+def auto_ajustar_columnas(writer, df, sheet_name):
+    ajustar_columnas(writer.sheets[sheet_name], df)
+
+
+class AnchosIncrementales:
+    """
+    Lleva el ancho máximo por columna mientras se escriben bloques (modo
+    streaming), midiendo cada bloque con operaciones vectorizadas.
+    """
+
+    def __init__(self, columnas, tope=AUTOFIT_TOPE):
+        self.columnas = list(columnas)
+        self.tope = tope
+        self._max = [len(str(c)) for c in self.columnas]
+
+    def actualizar(self, df, muestra=AUTOFIT_MUESTRA):
+        filas = _muestra(df, muestra)
+        for idx, col in enumerate(self.columnas):
+            if self._max[idx] + 2 < self.tope:
+                self._max[idx] = max(self._max[idx], _max_len(filas[col]))
+
+    def anchos(self):
+        return [min(m + 2, self.tope) for m in self._max]
+
+    def aplicar(self, ws):
+        for idx, ancho in enumerate(self.anchos()):
+            ws.set_column(idx, idx, ancho)
+
+
+@medido("exportacion", formato="xlsx")
+def excel_viaticos(df):
+    """Bytes de un .xlsx con `df` en la hoja "Viaticos" y columnas auto-ajustadas."""
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+        df.to_excel(writer, index=False, sheet_name=SHEET_NAME)
+        auto_ajustar_columnas(writer, df, SHEET_NAME)
+    return output.getvalue()
+
+
+def registrar_tamano(formato, tamano):
+    """Tamaño (bytes) de un archivo entregado, en el histograma export_bytes."""
+    observar("export_bytes", tamano, buckets=BUCKETS_BYTES, formato=formato)
+
+
+def hash_tabla(df):
+    """Hash estable del contenido (columnas + valores) de un DataFrame."""
+    h = hashlib.sha256()
+    h.update("\x1f".join(map(str, df.columns)).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+class ExportCache:
+    """LRU de bytes acotado por tamaño total."""
+
+    def __init__(self, max_bytes=EXPORT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._datos = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, clave):
+        with self._lock:
+            datos = self._datos.get(clave)
+            if datos is None:
+                self.misses += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.hits += 1
+            return datos
+
+    def set(self, clave, datos):
+        if len(datos) > self.max_bytes:
+            return
+        with self._lock:
+            anterior = self._datos.pop(clave, None)
+            if anterior is not None:
+                self._bytes -= len(anterior)
+            self._datos[clave] = datos
+            self._bytes += len(datos)
+            while self._bytes > self.max_bytes:
+                _, viejo = self._datos.popitem(last=False)
+                self._bytes -= len(viejo)
+
+    def get_or_build(self, clave, construir):
+        datos = self.get(clave)
+        if datos is None:
+            datos = construir()
+            self.set(clave, datos)
+        return datos
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "entradas": len(self._datos), "bytes": self._bytes}
+
+
+_export_cache = ExportCache()
+
+
+def get_export_cache():
+    return _export_cache
+
+
+def _metricas_export_cache():
+    stats = _export_cache.stats()
+    total = stats["hits"] + stats["misses"]
+    return [({"dato": "hit_ratio"}, stats["hits"] / total if total else 0.0),
+            ({"dato": "entradas"}, stats["entradas"]),
+            ({"dato": "bytes"}, stats["bytes"])]
+
+
+get_metricas().gauge("export_cache", _metricas_export_cache, "Caché de exportaciones xlsx")
+
+
+def excel_cacheado(df):
+    """Como excel_viaticos, pero servido del caché si ya se generó este mismo contenido."""
+    return _export_cache.get_or_build(hash_tabla(df), lambda: excel_viaticos(df))
+
+
+# ------------ Otros formatos -------------
+# CSV por bloques (generador de bytes) y formatos columnares de Arrow. Usan las
+# mismas columnas que el DataFrame exportado.
+CSV_MIME = "text/csv"
+PARQUET_MIME = "application/vnd.apache.parquet"
+ARROW_MIME = "application/vnd.apache.arrow.file"
+CSV_FILAS_POR_BLOQUE = 10000
+
+# clave -> (etiqueta, extensión, mime)
+FORMATOS = {
+    "xlsx": ("Excel (.xlsx)", ".xlsx", XLSX_MIME),
+    "csv": ("CSV (.csv)", ".csv", CSV_MIME),
+    "parquet": ("Parquet (.parquet)", ".parquet", PARQUET_MIME),
+    "arrow": ("Arrow (.arrow)", ".arrow", ARROW_MIME),
+}
+_FORMATOS_ARROW = {"parquet", "arrow"}
+
+
+def pyarrow_disponible():
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def formatos_disponibles():
+    """Claves de FORMATOS utilizables en este entorno (Parquet/Arrow requieren pyarrow)."""
+    con_arrow = pyarrow_disponible()
+    return [f for f in FORMATOS if con_arrow or f not in _FORMATOS_ARROW]
+
+
+def csv_en_bloques(df, filas=CSV_FILAS_POR_BLOQUE):
+    """
+    Genera el CSV de `df` como bloques de bytes (UTF-8 con BOM, para que Excel
+    respete los acentos) sin armar nunca el archivo completo en memoria.
+    """
+    yield "\ufeff".encode("utf-8") + df.iloc[:0].to_csv(index=False).encode("utf-8")
+    for inicio in range(0, len(df), filas):
+        yield df.iloc[inicio:inicio + filas].to_csv(header=False, index=False).encode("utf-8")
+
+
+def tabla_arrow(df):
+    import pyarrow as pa
+
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def parquet_bytes(df):
+    import pyarrow.parquet as pq
+
+    output = BytesIO()
+    pq.write_table(tabla_arrow(df), output)
+    return output.getvalue()
+
+
+def arrow_bytes(df):
+    """Archivo Arrow IPC (Feather v2)."""
+    import pyarrow as pa
+
+    tabla = tabla_arrow(df)
+    output = BytesIO()
+    with pa.ipc.new_file(output, tabla.schema) as writer:
+        writer.write_table(tabla)
+    return output.getvalue()
+
+
+def exportar_tabla(df, formato="xlsx"):
+    """Bytes de `df` en `formato` (clave de FORMATOS). El xlsx sale del caché de exportaciones."""
+    if formato == "xlsx":
+        datos = excel_cacheado(df)
+    elif formato == "csv":
+        with span("exportacion", formato="csv"):
+            datos = b"".join(csv_en_bloques(df))
+    elif formato == "parquet":
+        with span("exportacion", formato="parquet"):
+            datos = parquet_bytes(df)
+    elif formato == "arrow":
+        with span("exportacion", formato="arrow"):
+            datos = arrow_bytes(df)
+    else:
+        raise ValueError(f"Formato no soportado: {formato}")
+    registrar_tamano(formato, len(datos))
+    return datos
+
+
+# ------------ Reporte con marca -------------
+LOGO_PATH = "logo.png"
+
+
+class PlantillaReporte:
+    """
+    Layout del reporte de viáticos con marca (logo, título, subtítulo,
+    encabezados y anchos), resuelto una sola vez. Cada exportación sólo crea
+    el libro, registra los formatos ya definidos y escribe las filas.
+    """
+
+    TITULO_FMT = {"bold": True, "font_size": 20, "align": "left", "valign": "vcenter"}
+    SUBTITULO_FMT = {"italic": True, "font_size": 10, "font_color": "#555555"}
+    ENCABEZADO_FMT = {"bold": True, "bg_color": "#F2F2F2", "border": 1}
+
+    def __init__(self, columnas, titulo="Reporte de Viáticos",
+                 subtitulo="Generado por Calculadora de Viáticos",
+                 logo_path=LOGO_PATH, fila_encabezado=6, rango_titulo="C1:H2"):
+        from activos import cargar_logo
+
+        self.columnas = list(columnas)
+        self.titulo = titulo
+        self.subtitulo = subtitulo
+        self.fila_encabezado = fila_encabezado
+        self.rango_titulo = rango_titulo
+        # El logo se guarda ya reducido al tamaño en que se ve en la hoja (40 %),
+        # así cada libro comprime una imagen chica en lugar del PNG completo
+        original = cargar_logo(logo_path, ancho=None) if logo_path else None
+        logo = cargar_logo(logo_path, ancho=round(original.ancho * 0.4)) if original is not None else None
+        self.logo_png = logo.display_png if logo is not None else None
+        self.anchos = [min(max(len(str(c)) + 2, 12), AUTOFIT_TOPE) for c in self.columnas]
+
+    def escribir(self, destino, filas, anchos=None):
+        """
+        Escribe el reporte en `destino` (ruta o BytesIO). `filas` es un
+        iterable de secuencias en el orden de `columnas`; `anchos` reemplaza
+        los anchos de la plantilla.
+        """
+        import xlsxwriter
+
+        wb = xlsxwriter.Workbook(destino, {"in_memory": True, "nan_inf_to_errors": True})
+        try:
+            ws = wb.add_worksheet(SHEET_NAME)
+            titulo_fmt = wb.add_format(self.TITULO_FMT)
+            subtitulo_fmt = wb.add_format(self.SUBTITULO_FMT)
+            encabezado_fmt = wb.add_format(self.ENCABEZADO_FMT)
+
+            if self.logo_png is not None:
+                ws.insert_image("A1", LOGO_PATH, {"image_data": BytesIO(self.logo_png)})
+            ws.merge_range(self.rango_titulo, self.titulo, titulo_fmt)
+            ws.write("C3", self.subtitulo, subtitulo_fmt)
+            for idx, ancho in enumerate(anchos or self.anchos):
+                ws.set_column(idx, idx, ancho)
+            ws.write_row(self.fila_encabezado, 0, self.columnas, encabezado_fmt)
+
+            fila = self.fila_encabezado + 1
+            for valores in filas:
+                ws.write_row(fila, 0, valores)
+                fila += 1
+        finally:
+            wb.close()
+
+    def a_bytes(self, df):
+        """
+        Reporte de un DataFrame (columnas en el orden de la plantilla) como
+        bytes .xlsx. Los anchos de la plantilla funcionan como mínimo y se
+        amplían con el auto-ajuste por muestra de los datos.
+        """
+        with span("exportacion", formato="reporte"):
+            df = df[self.columnas]
+            anchos = [max(a, b) for a, b in zip(self.anchos, anchos_columnas(df))]
+            output = BytesIO()
+            self.escribir(output, df.itertuples(index=False, name=None), anchos)
+            datos = output.getvalue()
+        registrar_tamano("reporte", len(datos))
+        return datos
+
+
+_plantillas = {}
+_plantillas_lock = threading.Lock()
+
+
+def plantilla_reporte(columnas):
+    """Plantilla compartida por proceso para un juego de columnas."""
+    clave = tuple(columnas)
+    with _plantillas_lock:
+        if clave not in _plantillas:
+            _plantillas[clave] = PlantillaReporte(clave)
+        return _plantillas[clave]
@@ -0,0 +1,136 @@
+"""
+Gazetteer local de ciudades ya geocodificadas.
+
+Se carga una vez por proceso desde data/ciudades_mx.csv más las ciudades que
+se hayan resuelto por red (guardadas en SQLite junto al caché de rutas). Los
+nombres se comparan sin acentos ni mayúsculas ("Querétaro" == "queretaro").
+Búsqueda exacta por dict y por prefijo con bisect sobre las claves ordenadas.
+"""
+import bisect
+import csv
+import os
+import sqlite3
+import threading
+
+from cache_rutas import CACHE_DB_PATH, normalizar_lugar
+
+GAZETTEER_CSV = os.getenv(
+    "VIATICOS_GAZETTEER",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ciudades_mx.csv"),
+)
+
+
+class Gazetteer:
+    """Índice nombre normalizado -> (lon, lat)."""
+
+    def __init__(self, csv_path=GAZETTEER_CSV, db_path=CACHE_DB_PATH):
+        self._coords = {}
+        self._nombres = {}  # clave -> nombre para mostrar
+        self._claves = []   # ordenadas, para prefijos
+        self._lock = threading.Lock()
+        self._conn = None
+        if csv_path and os.path.exists(csv_path):
+            self._cargar_csv(csv_path)
+        if db_path:
+            self._conn = self._abrir(db_path)
+        self._claves = sorted(self._coords)
+
+    def _cargar_csv(self, path):
+        with open(path, newline="", encoding="utf-8") as f:
+            for fila in csv.DictReader(f):
+                coords = (float(fila["lon"]), float(fila["lat"]))
+                nombres = [fila["nombre"]] + [a for a in (fila.get("alias") or "").split("|") if a]
+                for nombre in nombres:
+                    self._indexar(nombre, coords, fila["nombre"])
+
+    def _abrir(self, path):
+        try:
+            carpeta = os.path.dirname(path)
+            if carpeta:
+                os.makedirs(carpeta, exist_ok=True)
+            conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocodigos ("
+                " clave TEXT PRIMARY KEY, nombre TEXT NOT NULL, lon REAL NOT NULL, lat REAL NOT NULL)"
+            )
+            conn.commit()
+            for clave, nombre, lon, lat in conn.execute("SELECT clave, nombre, lon, lat FROM geocodigos"):
+                self._coords.setdefault(clave, (lon, lat))
+                self._nombres.setdefault(clave, nombre)
+            return conn
+        except sqlite3.Error:
+            return None
+
+    def _indexar(self, nombre, coords, nombre_oficial):
+        clave = normalizar_lugar(nombre)
+        if clave:
+            self._coords.setdefault(clave, coords)
+            self._nombres.setdefault(clave, nombre_oficial)
+        return clave
+
+    # ------------ API -------------
+    def buscar(self, texto):
+        """(lon, lat) o None. Prueba el texto completo y luego lo anterior a la primera coma."""
+        clave = normalizar_lugar(texto)
+        coords = self._coords.get(clave)
+        if coords is None and "," in clave:
+            coords = self._coords.get(clave.split(",", 1)[0].strip())
+        return coords
+
+    def sugerencias(self, prefijo, limite=10):
+        """Nombres cuyo texto normalizado empieza con `prefijo`."""
+        prefijo = normalizar_lugar(prefijo)
+        if not prefijo:
+            return []
+        with self._lock:
+            i = bisect.bisect_left(self._claves, prefijo)
+            vistos = []
+            while i < len(self._claves) and self._claves[i].startswith(prefijo) and len(vistos) < limite:
+                nombre = self._nombres[self._claves[i]]
+                if nombre not in vistos:
+                    vistos.append(nombre)
+                i += 1
+            return vistos
+
+    def agregar(self, texto, lon, lat):
+        """Agrega (o ignora si ya existe) una ciudad resuelta por red; persiste en SQLite."""
+        clave = normalizar_lugar(texto)
+        if not clave or clave in self._coords:
+            return
+        with self._lock:
+            self._coords[clave] = (float(lon), float(lat))
+            self._nombres[clave] = str(texto).strip()
+            bisect.insort(self._claves, clave)
+            if self._conn is not None:
+                try:
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO geocodigos (clave, nombre, lon, lat) VALUES (?, ?, ?, ?)",
+                        (clave, str(texto).strip(), float(lon), float(lat)),
+                    )
+                    self._conn.commit()
+                except sqlite3.Error:
+                    pass
+
+    def geocodificar(self, texto, por_red):
+        """Coordenadas desde el gazetteer; sólo en un miss llama `por_red(texto)` y guarda el resultado."""
+        coords = self.buscar(texto)
+        if coords is not None:
+            return coords
+        coords = por_red(texto)
+        if coords:
+            self.agregar(texto, *coords)
+        return coords
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """Instancia única por proceso."""
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                _gazetteer = Gazetteer()
+    return _gazetteer
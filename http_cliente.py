@@ -0,0 +1,54 @@
+"""
+Cliente HTTP compartido por todos los proveedores de distancia.
+
+Una sola requests.Session por proceso con pool de conexiones keep-alive, así
+las consultas a Google (Directions / Distance Matrix) y a ORS reutilizan las
+conexiones TLS en lugar de pagar un handshake por llamada.
+"""
+import os
+import threading
+
+from perezoso import lazy_import
+
+requests = lazy_import("requests")
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("VIATICOS_HTTP_CONNECT_TIMEOUT", 3.05))
+HTTP_READ_TIMEOUT = float(os.getenv("VIATICOS_HTTP_READ_TIMEOUT", 15))
+HTTP_POOL_SIZE = int(os.getenv("VIATICOS_HTTP_POOL_SIZE", 32))
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def timeout(read=None):
+    """Tupla (connect, read) para requests; `read` sobrescribe el default."""
+    return (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT if read is None else read)
+
+
+def get_session():
+    """Session única por proceso (los reintentos los maneja cada proveedor)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                from requests.adapters import HTTPAdapter
+
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                s.headers.update({"Accept": "application/json"})
+                _session = s
+    return _session
+
+
+def get_json(url, params=None, headers=None, read_timeout=None):
+    r = get_session().get(url, params=params, headers=headers, timeout=timeout(read_timeout))
+    r.raise_for_status()
+    return r.json()
+
+
+def post_json(url, body, headers=None, read_timeout=None):
+    r = get_session().post(url, json=body, headers=headers, timeout=timeout(read_timeout))
+    r.raise_for_status()
+    return r.json()
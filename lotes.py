@@ -0,0 +1,299 @@
+"""
+Costeo masivo de viajes.
+
+Lee un CSV/XLSX con las mismas columnas que DEFAULTS en bloques, costea cada
+bloque con el motor vectorizado y escribe la hoja "Viaticos" fila por fila
+con xlsxwriter en modo constant_memory, así la memoria no crece con el
+número de filas.
+"""
+import os
+import tempfile
+import time
+
+from casetas import casetas_lote
+from calculos import COLUMNAS_EXCEL, calcular_viaticos, normalizar_viajes, tabla_viaticos
+from estimador import estimar_km_lote
+from exportar import FORMATOS, AnchosIncrementales, registrar_tamano
+from matriz_rutas import get_matriz_rutas
+from metricas import span
+from perezoso import lazy_import
+
+pd = lazy_import("pandas")
+xlsxwriter = lazy_import("xlsxwriter")
+
+CHUNK_SIZE = 5000
+SHEET_NAME = "Viaticos"
+
+# Resultados de costear_archivo: cada uno se borra al pasar LOTES_TTL_S desde
+# que se escribió (la sesión que lo generó puede no volver nunca)
+LOTES_DIR = os.getenv("VIATICOS_LOTES_DIR", os.path.join(tempfile.gettempdir(), "viaticos_lotes"))
+LOTES_TTL_S = float(os.getenv("VIATICOS_LOTES_TTL_S", 6 * 3600))
+
+
+def _leer_csv(archivo, chunk_size):
+    if isinstance(archivo, (str, os.PathLike)):
+        with open(archivo, "rb") as f:
+            yield from _leer_csv(f, chunk_size)
+        return
+    total = _tamano(archivo)
+    for bloque in pd.read_csv(archivo, chunksize=chunk_size):
+        yield bloque, (min(archivo.tell() / total, 1.0) if total else None)
+
+
+def _leer_xlsx(archivo, chunk_size):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        filas = ws.iter_rows(values_only=True)
+        encabezado = [str(c).strip() if c is not None else "" for c in next(filas, [])]
+        total = (ws.max_row - 1) if ws.max_row else None
+        leidas = 0
+        bloque = []
+        for fila in filas:
+            bloque.append(fila)
+            if len(bloque) >= chunk_size:
+                leidas += len(bloque)
+                yield pd.DataFrame(bloque, columns=encabezado), (min(leidas / total, 1.0) if total else None)
+                bloque = []
+        if bloque:
+            yield pd.DataFrame(bloque, columns=encabezado), 1.0
+    finally:
+        wb.close()
+
+
+def _tamano(archivo):
+    try:
+        pos = archivo.tell()
+        archivo.seek(0, os.SEEK_END)
+        total = archivo.tell()
+        archivo.seek(pos)
+        return total
+    except (AttributeError, OSError):
+        return None
+
+
+def leer_viajes_en_bloques(archivo, nombre, chunk_size=CHUNK_SIZE):
+    """Genera (DataFrame, fracción_leída) desde un CSV o XLSX (ruta o archivo abierto)."""
+    if nombre.lower().endswith((".xlsx", ".xlsm")):
+        return _leer_xlsx(archivo, chunk_size)
+    return _leer_csv(archivo, chunk_size)
+
+
+def completar_distancias(bloque, resolver=None):
+    """
+    Llena `distancia_km` de los viajes en Auto que la traen vacía o en 0 y
+    tienen origen/destino. Primero con la matriz precalculada de sucursales
+    (si existe), luego con `resolver(pares, pais=...)` (lista de km o None
+    alineada con `pares`, p. ej. proveedores.resolver_distancias) y lo que
+    quede con el estimador local; esas filas se marcan en la columna
+    `distancia_estimada`. Los km encontrados se redondean a 2 decimales,
+    igual que en el costeo de un solo viaje.
+    """
+    bloque = normalizar_viajes(bloque)
+    bloque["distancia_estimada"] = False
+    faltan = (
+        (bloque["medio"] == "Auto")
+        & (bloque["distancia_km"] <= 0)
+        & (bloque["origen"].str.strip() != "")
+        & (bloque["destino"].str.strip() != "")
+    )
+    matriz = get_matriz_rutas()
+    if matriz is not None and faltan.any():
+        aplica = bloque["pais"].map({p: matriz.aplica(p) for p in bloque.loc[faltan, "pais"].unique()})
+        en_matriz = faltan & aplica.fillna(False).astype(bool)
+        km = pd.Series(
+            matriz.km_lote(bloque.loc[en_matriz, "origen"], bloque.loc[en_matriz, "destino"]),
+            index=bloque.index[en_matriz],
+        ).dropna()
+        bloque.loc[km.index, "distancia_km"] = km.round(2)
+        faltan &= bloque["distancia_km"] <= 0
+
+    if resolver is not None:
+        for pais, grupo in bloque[faltan].groupby("pais", sort=False):
+            km = resolver(list(zip(grupo["origen"], grupo["destino"])), pais=pais)
+            km = pd.Series(km, index=grupo.index, dtype="float64").fillna(0.0)
+            bloque.loc[grupo.index, "distancia_km"] = km.round(2)
+        faltan &= bloque["distancia_km"] <= 0
+
+    if faltan.any():
+        aprox = pd.Series(
+            estimar_km_lote(bloque.loc[faltan, "origen"], bloque.loc[faltan, "destino"]),
+            index=bloque.index[faltan],
+        ).dropna()
+        bloque.loc[aprox.index, "distancia_km"] = aprox.round(2)
+        bloque.loc[aprox.index, "distancia_estimada"] = True
+    return bloque
+
+
+def completar_casetas(bloque):
+    """
+    Llena `casetas` de los viajes en Auto que la traen en 0 y tienen
+    origen/destino: por la columna `plazas` (secuencia "A|B") si existe y
+    luego por ruta (ver casetas.casetas_lote). Sin dato se queda en 0.
+    """
+    faltan = (
+        (bloque["medio"] == "Auto")
+        & (bloque["casetas"] <= 0)
+        & (bloque["origen"].str.strip() != "")
+        & (bloque["destino"].str.strip() != "")
+    )
+    if not faltan.any():
+        return bloque
+    plazas = bloque.loc[faltan, "plazas"].fillna("") if "plazas" in bloque.columns else None
+    costo = pd.Series(
+        casetas_lote(bloque.loc[faltan, "origen"], bloque.loc[faltan, "destino"], bloque.loc[faltan, "pais"], plazas),
+        index=bloque.index[faltan],
+    ).dropna()
+    bloque.loc[costo.index, "casetas"] = costo
+    return bloque
+
+
+def costear_bloque(bloque, resolver=None):
+    """Bloque de viajes -> tabla con el layout de la hoja "Viaticos" (distancias y casetas completadas)."""
+    return tabla_viaticos(calcular_viaticos(completar_casetas(completar_distancias(bloque, resolver)), con_detalle=True))
+
+
+def escribir_xlsx(tablas, destino, progreso=None):
+    """
+    Escribe las tablas de `tablas` (iterable de (tabla, fracción), ver
+    costear_bloque) una tras otra en la hoja "Viaticos" de `destino`.
+    `progreso(fraccion, filas)` se llama tras cada tabla. Devuelve las filas escritas.
+    """
+    wb = xlsxwriter.Workbook(destino, {"constant_memory": True, "nan_inf_to_errors": True})
+    ws = wb.add_worksheet(SHEET_NAME)
+    encabezado = list(COLUMNAS_EXCEL)
+    ws.write_row(0, 0, encabezado)
+    anchos = AnchosIncrementales(encabezado)
+    fila = 1
+    try:
+        for tabla, fraccion in tablas:
+            anchos.actualizar(tabla)
+            for valores in tabla.itertuples(index=False, name=None):
+                ws.write_row(fila, 0, valores)
+                fila += 1
+            if progreso is not None:
+                progreso(fraccion, fila - 1)
+        anchos.aplicar(ws)
+    finally:
+        wb.close()
+    return fila - 1
+
+
+def escribir_csv(tablas, destino, progreso=None):
+    """Como escribir_xlsx, pero a un CSV UTF-8 (con BOM, para que Excel respete los acentos)."""
+    filas = 0
+    with open(destino, "w", encoding="utf-8-sig", newline="") as f:
+        f.write(",".join(COLUMNAS_EXCEL) + "\n")
+        for tabla, fraccion in tablas:
+            tabla.to_csv(f, header=False, index=False)
+            filas += len(tabla)
+            if progreso is not None:
+                progreso(fraccion, filas)
+    return filas
+
+
+def _escribir_pyarrow(tablas, destino, progreso, abrir):
+    import pyarrow as pa
+
+    writer = esquema = None
+    filas = 0
+    try:
+        for tabla, fraccion in tablas:
+            # El esquema lo fija el primer bloque; los demás se convierten a él
+            lote = pa.Table.from_pandas(tabla, schema=esquema, preserve_index=False)
+            if writer is None:
+                esquema = lote.schema
+                writer = abrir(destino, esquema)
+            writer.write_table(lote)
+            filas += len(tabla)
+            if progreso is not None:
+                progreso(fraccion, filas)
+    finally:
+        if writer is not None:
+            writer.close()
+    return filas
+
+
+def escribir_parquet(tablas, destino, progreso=None):
+    """Como escribir_xlsx, pero a Parquet: un row group por tabla, sin juntar todo en memoria."""
+    import pyarrow.parquet as pq
+
+    return _escribir_pyarrow(tablas, destino, progreso, pq.ParquetWriter)
+
+
+def escribir_arrow(tablas, destino, progreso=None):
+    """Como escribir_xlsx, pero a un archivo Arrow IPC (Feather v2), un lote por tabla."""
+    import pyarrow as pa
+
+    return _escribir_pyarrow(tablas, destino, progreso, pa.ipc.new_file)
+
+
+# formato (clave de exportar.FORMATOS) -> escritor por bloques
+ESCRITORES = {
+    "xlsx": escribir_xlsx,
+    "csv": escribir_csv,
+    "parquet": escribir_parquet,
+    "arrow": escribir_arrow,
+}
+
+
+def formato_de_ruta(ruta):
+    """Formato según la extensión de `ruta` (xlsx si no se reconoce)."""
+    ext = os.path.splitext(ruta)[1].lower()
+    for formato, (_, extension, _) in FORMATOS.items():
+        if ext == extension:
+            return formato
+    return "xlsx"
+
+
+def costear_a_xlsx(bloques, destino, progreso=None, resolver=None):
+    """
+    Costea cada bloque de `bloques` (iterable de (DataFrame, fracción)) y lo
+    escribe en `destino` (ruta .xlsx). `progreso(fraccion, filas)` se llama
+    tras cada bloque. Antes se completan las distancias faltantes (ver
+    completar_distancias). Devuelve el número de filas escritas.
+    """
+    tablas = ((costear_bloque(bloque, resolver), fraccion) for bloque, fraccion in bloques)
+    return escribir_xlsx(tablas, destino, progreso)
+
+
+def limpiar_lotes(carpeta=LOTES_DIR, ttl=LOTES_TTL_S):
+    """Borra los resultados de carpeta con más de `ttl` segundos. Devuelve cuántos borró."""
+    limite = time.time() - ttl
+    borrados = 0
+    try:
+        entradas = list(os.scandir(carpeta))
+    except OSError:
+        return 0
+    for entrada in entradas:
+        try:
+            if entrada.is_file() and entrada.stat().st_mtime < limite:
+                os.remove(entrada.path)
+                borrados += 1
+        except OSError:
+            # Otro proceso lo borró primero
+            pass
+    return borrados
+
+
+def costear_archivo(archivo, nombre, chunk_size=CHUNK_SIZE, progreso=None, resolver=None, formato="xlsx"):
+    """
+    Costea un archivo de viajes a un archivo en LOTES_DIR (xlsx, csv, parquet
+    o arrow). Devuelve (ruta, filas). De paso borra los resultados vencidos.
+    """
+    limpiar_lotes()
+    os.makedirs(LOTES_DIR, exist_ok=True)
+    fd, destino = tempfile.mkstemp(prefix="viaticos_", suffix=FORMATOS[formato][1], dir=LOTES_DIR)
+    os.close(fd)
+    tablas = ((costear_bloque(bloque, resolver), fraccion)
+              for bloque, fraccion in leer_viajes_en_bloques(archivo, nombre, chunk_size))
+    try:
+        with span("lote", formato=formato):
+            filas = ESCRITORES[formato](tablas, destino, progreso)
+    except Exception:
+        os.remove(destino)
+        raise
+    registrar_tamano(f"lote_{formato}", os.path.getsize(destino))
+    return destino, filas
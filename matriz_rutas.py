@@ -0,0 +1,233 @@
+"""
+Matriz precalculada de distancias (y casetas) entre las ciudades de la red de
+sucursales y clientes frecuentes.
+
+Se construye una vez, fuera de línea (ver `viaticos.py matriz`). Cada
+construcción queda en su propia subcarpeta de MATRIZ_DIR con:
+- km.npy y casetas.npy: float64 N x N, una vía, NaN = sin dato;
+- ciudades.json: nombres (el índice de cada fila/columna), alias y metadatos;
+y el archivo MATRIZ_DIR/actual (el nombre de la subcarpeta vigente) se
+reemplaza al final, de forma atómica: un proceso nunca mezcla el índice de
+una versión con los arreglos de otra.
+
+Los procesos la abren con np.load(mmap_mode="r"): no se copia a memoria, el
+sistema operativo comparte las páginas entre todos los workers, y cada
+búsqueda es un dict (nombre -> índice) más una lectura del arreglo. Una ruta
+fuera de la matriz sigue el camino normal (caché de rutas / proveedores).
+"""
+import csv
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from cache_rutas import normalizar_lugar
+
+MATRIZ_DIR = os.getenv(
+    "VIATICOS_MATRIZ_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "matriz"),
+)
+# Cada cuántos segundos se revisa si la matriz se (re)construyó
+MATRIZ_REVISION_S = float(os.getenv("VIATICOS_MATRIZ_REVISION_S", 30))
+ARCHIVO_KM = "km.npy"
+ARCHIVO_CASETAS = "casetas.npy"
+ARCHIVO_CIUDADES = "ciudades.json"
+ARCHIVO_ACTUAL = "actual"
+# Versiones anteriores que se conservan (un proceso puede estar abriéndolas)
+VERSIONES_CONSERVADAS = 2
+
+# Orígenes por bloque al construir (cada bloque es una llamada al resolver;
+# múltiplo de las bandas de 4, 5, 10 y 20 orígenes de planear_bloques)
+ORIGENES_POR_BLOQUE = 20
+
+
+def leer_ciudades(path):
+    """[(nombre, [alias...]), ...] desde un CSV con columna `nombre` y opcional `alias` (separados por |)."""
+    ciudades, vistos = [], set()
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for fila in csv.DictReader(f):
+            nombre = (fila.get("nombre") or "").strip()
+            if not nombre or normalizar_lugar(nombre) in vistos:
+                continue
+            vistos.add(normalizar_lugar(nombre))
+            ciudades.append((nombre, [a.strip() for a in (fila.get("alias") or "").split("|") if a.strip()]))
+    return ciudades
+
+
+class MatrizRutas:
+    """Búsquedas O(1) sobre una versión (subcarpeta) construida con `construir_matriz`."""
+
+    def __init__(self, carpeta):
+        with open(os.path.join(carpeta, ARCHIVO_CIUDADES), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.ciudades = meta["ciudades"]
+        self.pais = normalizar_lugar(meta.get("pais", ""))
+        self.meta = {k: v for k, v in meta.items() if k not in ("ciudades", "alias")}
+        self._indice = {}
+        for i, nombre in enumerate(self.ciudades):
+            self._indice.setdefault(normalizar_lugar(nombre), i)
+        for alias, i in meta.get("alias", []):
+            self._indice.setdefault(normalizar_lugar(alias), i)
+        self._km = np.load(os.path.join(carpeta, ARCHIVO_KM), mmap_mode="r")
+        ruta_casetas = os.path.join(carpeta, ARCHIVO_CASETAS)
+        self._casetas = np.load(ruta_casetas, mmap_mode="r") if os.path.exists(ruta_casetas) else None
+        n = len(self.ciudades)
+        for arreglo in (self._km, self._casetas):
+            if arreglo is not None and arreglo.shape != (n, n):
+                raise ValueError(f"Matriz {arreglo.shape} no corresponde a {n} ciudades en {carpeta}")
+
+    def __len__(self):
+        return len(self.ciudades)
+
+    def aplica(self, pais=""):
+        """La matriz es de un solo país: vale para `pais` vacío o igual al de la construcción."""
+        pais = normalizar_lugar(pais)
+        return not pais or not self.pais or pais == self.pais
+
+    def indice(self, texto):
+        """Fila/columna de la ciudad o -1. Prueba el texto completo y luego lo anterior a la primera coma."""
+        clave = normalizar_lugar(texto)
+        i = self._indice.get(clave, -1)
+        if i < 0 and "," in clave:
+            i = self._indice.get(clave.split(",", 1)[0].strip(), -1)
+        return i
+
+    def _valor(self, arreglo, origen, destino):
+        if arreglo is None:
+            return None
+        i, j = self.indice(origen), self.indice(destino)
+        if i < 0 or j < 0:
+            return None
+        valor = float(arreglo[i, j])
+        return None if np.isnan(valor) else valor
+
+    def km(self, origen, destino):
+        return self._valor(self._km, origen, destino)
+
+    def casetas(self, origen, destino):
+        return self._valor(self._casetas, origen, destino)
+
+    def _lote(self, arreglo, origenes, destinos):
+        origenes = np.asarray(origenes, dtype=object)
+        destinos = np.asarray(destinos, dtype=object)
+        salida = np.full(len(origenes), np.nan)
+        if arreglo is None or not len(origenes):
+            return salida
+        # Cada nombre distinto se busca una vez
+        nombres, inversa = np.unique(np.concatenate([origenes, destinos]).astype(str), return_inverse=True)
+        indices = np.array([self.indice(n) for n in nombres], dtype=np.int64)[inversa]
+        i, j = indices[:len(origenes)], indices[len(origenes):]
+        validos = (i >= 0) & (j >= 0)
+        salida[validos] = arreglo[i[validos], j[validos]]
+        return salida
+
+    def km_lote(self, origenes, destinos):
+        """Arreglo de km alineado con las entradas (NaN fuera de la matriz o sin dato)."""
+        return self._lote(self._km, origenes, destinos)
+
+    def casetas_lote(self, origenes, destinos):
+        return self._lote(self._casetas, origenes, destinos)
+
+
+# ------------ Construcción -------------
+def version_actual(carpeta=MATRIZ_DIR):
+    """Subcarpeta vigente (ruta completa) o None si no se ha construido."""
+    try:
+        with open(os.path.join(carpeta, ARCHIVO_ACTUAL), encoding="utf-8") as f:
+            nombre = f.read().strip()
+    except OSError:
+        return None
+    return os.path.join(carpeta, nombre) if nombre else None
+
+
+def _publicar(carpeta, nombre):
+    """Apunta `actual` a la subcarpeta `nombre` y borra las versiones viejas."""
+    temporal = os.path.join(carpeta, f".{ARCHIVO_ACTUAL}.{os.getpid()}.tmp")
+    with open(temporal, "w", encoding="utf-8") as f:
+        f.write(nombre)
+    os.replace(temporal, os.path.join(carpeta, ARCHIVO_ACTUAL))
+    versiones = sorted(d for d in os.listdir(carpeta) if d.startswith("v") and os.path.isdir(os.path.join(carpeta, d)))
+    for viejo in versiones[:-(VERSIONES_CONSERVADAS + 1)]:
+        if viejo != nombre:
+            shutil.rmtree(os.path.join(carpeta, viejo), ignore_errors=True)
+
+
+def construir_matriz(ciudades, carpeta, resolver, pais="", fuente="", casetas=None, progreso=None):
+    """
+    Calcula la matriz completa origen x destino de `ciudades` ([(nombre,
+    [alias...])] o nombres) y la guarda en `carpeta`. `resolver(pares,
+    pais=...)` devuelve km o None alineados con `pares` (la misma interfaz
+    que lotes.completar_distancias); `casetas`, igual, para el costo de
+    casetas. `progreso(fraccion)` tras cada bloque de orígenes. Devuelve las
+    rutas con distancia. Las búsquedas de otros procesos siguen con la
+    versión anterior hasta que esta queda completa.
+    """
+    ciudades = [(c, []) if isinstance(c, str) else (c[0], list(c[1])) for c in ciudades]
+    nombres = [nombre for nombre, _ in ciudades]
+    n = len(nombres)
+    km = np.full((n, n), np.nan)
+    costo = np.full((n, n), np.nan)
+    np.fill_diagonal(km, 0.0)
+    np.fill_diagonal(costo, 0.0)
+
+    for inicio in range(0, n, ORIGENES_POR_BLOQUE):
+        filas = range(inicio, min(n, inicio + ORIGENES_POR_BLOQUE))
+        celdas = [(i, j) for i in filas for j in range(n) if i != j]
+        pares = [(nombres[i], nombres[j]) for i, j in celdas]
+        if pares:
+            ii, jj = np.array(celdas).T
+            km[ii, jj] = np.array(resolver(pares, pais=pais), dtype=float)
+            if casetas is not None:
+                costo[ii, jj] = np.array(casetas(pares, pais=pais), dtype=float)
+        if progreso is not None:
+            progreso(filas.stop / n)
+
+    nombre = f"v{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 10 ** 9:09d}-{os.getpid()}"
+    version = os.path.join(carpeta, nombre)
+    os.makedirs(version)
+    np.save(os.path.join(version, ARCHIVO_KM), km)
+    np.save(os.path.join(version, ARCHIVO_CASETAS), costo)
+    meta = {
+        "ciudades": nombres,
+        "alias": [[alias, i] for i, (_, alias_ciudad) in enumerate(ciudades) for alias in alias_ciudad],
+        "pais": pais,
+        "fuente": fuente,
+        "creada": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "rutas_con_km": int(np.count_nonzero(~np.isnan(km)) - n),
+    }
+    with open(os.path.join(version, ARCHIVO_CIUDADES), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+    _publicar(carpeta, nombre)
+    return meta["rutas_con_km"]
+
+
+_matriz = None
+_matriz_version = None
+_matriz_revisada = None
+_matriz_lock = threading.Lock()
+
+
+def get_matriz_rutas():
+    """
+    Instancia única por proceso, o None si no hay matriz en MATRIZ_DIR. Si
+    se reconstruye, los procesos la vuelven a abrir en la siguiente revisión.
+    """
+    global _matriz, _matriz_version, _matriz_revisada
+    ahora = time.monotonic()
+    if _matriz_revisada is not None and ahora - _matriz_revisada < MATRIZ_REVISION_S:
+        return _matriz
+    with _matriz_lock:
+        if _matriz_revisada is None or ahora - _matriz_revisada >= MATRIZ_REVISION_S:
+            version = version_actual(MATRIZ_DIR)
+            if version != _matriz_version:
+                try:
+                    _matriz = MatrizRutas(version) if version is not None else None
+                    _matriz_version = version
+                except (OSError, ValueError, KeyError):
+                    # Versión incompleta o ya borrada: se reintenta en la siguiente revisión
+                    _matriz = None
+            _matriz_revisada = time.monotonic()
+    return _matriz
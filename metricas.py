@@ -0,0 +1,251 @@
+"""
+Métricas en proceso para los caminos calientes de la calculadora.
+
+Spans de tiempo (histogramas en segundos), contadores y valores puntuales
+(gauges) leídos al exportar, p. ej. la tasa de aciertos de los cachés. Se
+exportan en el formato de texto de Prometheus: en /metricas del servicio
+HTTP, en el panel de administración de la página y, si se define
+VIATICOS_METRICAS_ARCHIVO, en un archivo para el textfile collector de
+node_exporter.
+
+Cada proceso lleva sus propias métricas; con varios workers cada uno debe
+exportar a su propio archivo (el nombre admite {pid}).
+"""
+import bisect
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIJO = "viaticos_"
+METRICAS_ARCHIVO = os.getenv("VIATICOS_METRICAS_ARCHIVO", "")
+METRICAS_INTERVALO_S = float(os.getenv("VIATICOS_METRICAS_INTERVALO_S", 15))
+
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_BYTES = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+
+class Histograma:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.cuentas = [0] * (len(self.buckets) + 1)  # el último es +Inf
+        self.suma = 0.0
+        self.n = 0
+
+    def observar(self, valor):
+        self.cuentas[bisect.bisect_left(self.buckets, valor)] += 1
+        self.suma += valor
+        self.n += 1
+
+    def cuantil(self, q):
+        """Cuantil aproximado (límite superior del bucket donde cae)."""
+        if not self.n:
+            return None
+        objetivo = q * self.n
+        acumulado = 0
+        for limite, cuenta in zip(self.buckets + (float("inf"),), self.cuentas):
+            acumulado += cuenta
+            if acumulado >= objetivo:
+                return limite
+        return float("inf")
+
+
+def _etiquetas(etiquetas):
+    return tuple(sorted((k, str(v)) for k, v in etiquetas.items()))
+
+
+def _formato_etiquetas(etiquetas, extra=()):
+    pares = list(etiquetas) + list(extra)
+    if not pares:
+        return ""
+    texto = ",".join(f'{k}="{v.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                     for k, v in pares)
+    return "{" + texto + "}"
+
+
+def _numero(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Metricas:
+    """Registro de histogramas, contadores y gauges con etiquetas."""
+
+    def __init__(self):
+        self._histogramas = {}  # nombre -> (buckets, ayuda, {etiquetas: Histograma})
+        self._contadores = {}   # nombre -> (ayuda, {etiquetas: valor})
+        self._gauges = {}       # nombre -> (ayuda, fn() -> [(etiquetas, valor)])
+        self._lock = threading.Lock()
+        self._ultimo_export = 0.0
+
+    # ------------ Registro -------------
+    def observar(self, nombre, valor, buckets=BUCKETS_SEGUNDOS, ayuda="", **etiquetas):
+        clave = _etiquetas(etiquetas)
+        with self._lock:
+            serie = self._histogramas.get(nombre)
+            if serie is None:
+                serie = self._histogramas[nombre] = (tuple(buckets), ayuda, {})
+            h = serie[2].get(clave)
+            if h is None:
+                h = serie[2][clave] = Histograma(serie[0])
+            h.observar(valor)
+
+    def contar(self, nombre, valor=1, ayuda="", **etiquetas):
+        clave = _etiquetas(etiquetas)
+        with self._lock:
+            serie = self._contadores.setdefault(nombre, (ayuda, {}))
+            serie[1][clave] = serie[1].get(clave, 0) + valor
+
+    def gauge(self, nombre, fn, ayuda=""):
+        """Registra `fn()`, que devuelve [(etiquetas dict, número), ...], evaluada al exportar."""
+        with self._lock:
+            self._gauges[nombre] = (ayuda, fn)
+
+    @contextmanager
+    def span(self, nombre, **etiquetas):
+        """Mide la duración del bloque en el histograma `<nombre>_seconds` (resultado=ok|error)."""
+        inicio = time.perf_counter()
+        resultado = "ok"
+        try:
+            yield
+        except Exception:
+            resultado = "error"
+            raise
+        finally:
+            self.observar(f"{nombre}_seconds", time.perf_counter() - inicio,
+                          resultado=resultado, **etiquetas)
+
+    def medido(self, nombre, **etiquetas):
+        """Decorador: cada llamada es un span."""
+        def decorador(fn):
+            @functools.wraps(fn)
+            def envoltura(*args, **kwargs):
+                with self.span(nombre, **etiquetas):
+                    return fn(*args, **kwargs)
+            return envoltura
+        return decorador
+
+    # ------------ Lectura -------------
+    def resumen(self):
+        """Filas (métrica, etiquetas, n, promedio, p50, p95, p99) de los histogramas."""
+        filas = []
+        with self._lock:
+            for nombre, (_, _, series) in sorted(self._histogramas.items()):
+                for clave, h in sorted(series.items()):
+                    filas.append({
+                        "métrica": nombre,
+                        "etiquetas": ", ".join(f"{k}={v}" for k, v in clave),
+                        "n": h.n,
+                        "promedio": h.suma / h.n if h.n else None,
+                        "p50": h.cuantil(0.5),
+                        "p95": h.cuantil(0.95),
+                        "p99": h.cuantil(0.99),
+                    })
+        return filas
+
+    def valores(self):
+        """Contadores y gauges como filas (métrica, etiquetas, valor)."""
+        filas = []
+        with self._lock:
+            contadores = {n: dict(s[1]) for n, s in self._contadores.items()}
+            gauges = dict(self._gauges)
+        for nombre, series in sorted(contadores.items()):
+            for clave, valor in sorted(series.items()):
+                filas.append({"métrica": nombre, "etiquetas": ", ".join(f"{k}={v}" for k, v in clave),
+                              "valor": valor})
+        for nombre, (_, fn) in sorted(gauges.items()):
+            for clave, valor in sorted(_leer_gauge(fn).items()):
+                filas.append({"métrica": nombre, "etiquetas": ", ".join(f"{k}={v}" for k, v in clave),
+                              "valor": valor})
+        return filas
+
+    def texto_prometheus(self):
+        lineas = []
+        with self._lock:
+            histogramas = {n: (s[1], {k: (h.buckets, list(h.cuentas), h.suma, h.n) for k, h in s[2].items()})
+                           for n, s in self._histogramas.items()}
+            contadores = {n: (s[0], dict(s[1])) for n, s in self._contadores.items()}
+            gauges = dict(self._gauges)
+
+        for nombre, (ayuda, series) in sorted(histogramas.items()):
+            completo = PREFIJO + nombre
+            if ayuda:
+                lineas.append(f"# HELP {completo} {ayuda}")
+            lineas.append(f"# TYPE {completo} histogram")
+            for clave, (buckets, cuentas, suma, n) in sorted(series.items()):
+                acumulado = 0
+                for limite, cuenta in zip(buckets + (float("inf"),), cuentas):
+                    acumulado += cuenta
+                    lineas.append(f"{completo}_bucket{_formato_etiquetas(clave, [('le', _numero(limite))])} {acumulado}")
+                lineas.append(f"{completo}_sum{_formato_etiquetas(clave)} {_numero(suma)}")
+                lineas.append(f"{completo}_count{_formato_etiquetas(clave)} {n}")
+
+        for nombre, (ayuda, series) in sorted(contadores.items()):
+            completo = PREFIJO + nombre + "_total"
+            if ayuda:
+                lineas.append(f"# HELP {completo} {ayuda}")
+            lineas.append(f"# TYPE {completo} counter")
+            for clave, valor in sorted(series.items()):
+                lineas.append(f"{completo}{_formato_etiquetas(clave)} {_numero(valor)}")
+
+        for nombre, (ayuda, fn) in sorted(gauges.items()):
+            completo = PREFIJO + nombre
+            if ayuda:
+                lineas.append(f"# HELP {completo} {ayuda}")
+            lineas.append(f"# TYPE {completo} gauge")
+            for clave, valor in sorted(_leer_gauge(fn).items()):
+                lineas.append(f"{completo}{_formato_etiquetas(clave)} {_numero(valor)}")
+        return "\n".join(lineas) + "\n"
+
+    # ------------ Exportación -------------
+    def exportar(self, ruta=None):
+        """Escribe el texto de Prometheus en `ruta` de forma atómica (rename)."""
+        ruta = (ruta or METRICAS_ARCHIVO).format(pid=os.getpid())
+        if not ruta:
+            return None
+        carpeta = os.path.dirname(ruta)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            f.write(self.texto_prometheus())
+        os.replace(temporal, ruta)
+        return ruta
+
+    def exportar_si_toca(self, intervalo=METRICAS_INTERVALO_S):
+        """Exporta a VIATICOS_METRICAS_ARCHIVO como mucho una vez cada `intervalo` segundos."""
+        if not METRICAS_ARCHIVO:
+            return
+        ahora = time.monotonic()
+        with self._lock:
+            if ahora - self._ultimo_export < intervalo:
+                return
+            self._ultimo_export = ahora
+        try:
+            self.exportar()
+        except OSError:
+            pass
+
+
+def _leer_gauge(fn):
+    try:
+        datos = fn()
+    except Exception:
+        return {}
+    return {_etiquetas(etiquetas): valor for etiquetas, valor in datos}
+
+
+_metricas = Metricas()
+
+
+def get_metricas():
+    return _metricas
+
+
+# Atajos sobre el registro del proceso
+span = _metricas.span
+medido = _metricas.medido
+observar = _metricas.observar
+contar = _metricas.contar
@@ -0,0 +1,63 @@
+"""
+Panel de métricas para administradores (oculto).
+
+Se muestra en lugar de la página cuando la URL trae ?admin=<token> y el token
+coincide con VIATICOS_ADMIN_TOKEN. Sin esa variable el panel no existe.
+"""
+import hmac
+import os
+
+import streamlit as st
+
+from metricas import METRICAS_ARCHIVO, get_metricas
+
+ADMIN_TOKEN = os.getenv("VIATICOS_ADMIN_TOKEN", "")
+
+
+def es_admin():
+    token = st.query_params.get("admin", "")
+    return bool(ADMIN_TOKEN) and bool(token) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def _segundos(valor):
+    if valor is None:
+        return "—"
+    if valor == float("inf"):
+        return "> 10 s"
+    return f"{valor * 1000:,.1f} ms" if valor < 1 else f"{valor:,.2f} s"
+
+
+def mostrar():
+    metricas = get_metricas()
+    st.title("📈 Métricas")
+    st.caption(f"Proceso {os.getpid()}. Los percentiles son el límite superior del bucket del histograma.")
+
+    filas = metricas.resumen()
+    tiempos = [f for f in filas if f["métrica"].endswith("_seconds")]
+    tamanos = [f for f in filas if not f["métrica"].endswith("_seconds")]
+
+    st.subheader("Tiempos")
+    if tiempos:
+        st.dataframe([
+            {**f, "promedio": _segundos(f["promedio"]), "p50": _segundos(f["p50"]),
+             "p95": _segundos(f["p95"]), "p99": _segundos(f["p99"])}
+            for f in tiempos
+        ], width="stretch", hide_index=True)
+    else:
+        st.info("Sin mediciones todavía.")
+
+    if tamanos:
+        st.subheader("Tamaños de exportación")
+        st.dataframe(tamanos, width="stretch", hide_index=True)
+
+    st.subheader("Cachés y contadores")
+    st.dataframe(metricas.valores(), width="stretch", hide_index=True)
+
+    texto = metricas.texto_prometheus()
+    col1, col2 = st.columns(2)
+    col1.download_button("Descargar (formato Prometheus)", texto, file_name="viaticos.prom",
+                         mime="text/plain", on_click="ignore", use_container_width=True)
+    if METRICAS_ARCHIVO and col2.button("Exportar a archivo ahora", use_container_width=True):
+        st.success(f"Escrito en {metricas.exportar()}")
+    with st.expander("Texto Prometheus"):
+        st.code(texto, language="text")
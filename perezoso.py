@@ -0,0 +1,38 @@
+"""
+Importaciones diferidas.
+
+Streamlit re-ejecuta la página en cada interacción y el primer render de un
+contenedor nuevo paga todas las importaciones del módulo. Las dependencias
+pesadas (pandas, xlsxwriter, requests...) sólo se usan al exportar o al
+consultar distancias, así que se importan en el primer uso.
+"""
+import importlib
+import threading
+
+_lock = threading.Lock()
+
+
+class ModuloPerezoso:
+    """Proxy que importa el módulo real la primera vez que se accede a un atributo."""
+
+    def __init__(self, nombre):
+        self._nombre = nombre
+        self._modulo = None
+
+    def _cargar(self):
+        if self._modulo is None:
+            with _lock:
+                if self._modulo is None:
+                    self._modulo = importlib.import_module(self._nombre)
+        return self._modulo
+
+    def __getattr__(self, atributo):
+        return getattr(self._cargar(), atributo)
+
+    def __repr__(self):
+        estado = "cargado" if self._modulo is not None else "sin cargar"
+        return f"<módulo perezoso {self._nombre!r} ({estado})>"
+
+
+def lazy_import(nombre):
+    return ModuloPerezoso(nombre)
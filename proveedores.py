@@ -0,0 +1,687 @@
+"""
+Proveedores de distancia por carretera (Google Directions, Google Distance
+Matrix y OpenRouteService) y resolución concurrente de muchos pares.
+
+Las funciones `*_km` lanzan ErrorTransitorio ante fallas que vale la pena
+reintentar (timeouts, HTTP 429/5xx, OVER_QUERY_LIMIT) y devuelven None si
+la ruta no existe. `km_google_distance`, `fetch_distance_google` y
+`driving_distance_km_ors` conservan la firma que usan las páginas.
+"""
+import os
+import threading
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import http_cliente
+from cache_rutas import clave_ruta, get_route_cache, normalizar_lugar
+from concurrencia import CircuitBreaker, CircuitoAbierto, Debouncer, SingleFlight, TokenBucket, con_reintentos
+from geocodificacion import get_gazetteer
+from matriz_rutas import get_matriz_rutas
+from metricas import contar, get_metricas, medido
+from perezoso import lazy_import
+
+requests = lazy_import("requests")
+
+# ------------ Config -------------
+# Las URLs base se pueden apuntar a otro servidor (p. ej. benchmarks/proveedor_falso.py)
+GOOGLE_DIRECTIONS_URL = os.getenv("VIATICOS_GOOGLE_DIRECTIONS_URL",
+                                  "https://maps.googleapis.com/maps/api/directions/json")
+GOOGLE_MATRIX_URL = os.getenv("VIATICOS_GOOGLE_MATRIX_URL",
+                              "https://maps.googleapis.com/maps/api/distancematrix/json")
+ORS_URL = os.getenv("VIATICOS_ORS_URL", "https://api.openrouteservice.org")
+
+# Peticiones por segundo por proveedor (ORS gratuito: 40/min en directions)
+RATE_LIMITS = {
+    "google": float(os.getenv("VIATICOS_RATE_GOOGLE", 25)),
+    "google_matrix": float(os.getenv("VIATICOS_RATE_GOOGLE_MATRIX", 25)),
+    "ors": float(os.getenv("VIATICOS_RATE_ORS", 40 / 60)),
+}
+MAX_WORKERS = int(os.getenv("VIATICOS_MAX_WORKERS", 8))
+
+# Consulta cubierta: orden de proveedores (vacío = orden de registro) y segundos antes de lanzar el de respaldo
+HEDGE_ORDEN = tuple(p.strip() for p in os.getenv("VIATICOS_HEDGE_ORDEN", "").split(",") if p.strip())
+HEDGE_UMBRAL_S = float(os.getenv("VIATICOS_HEDGE_UMBRAL_S", 0.8))
+HEDGE_WORKERS = int(os.getenv("VIATICOS_HEDGE_WORKERS", 16))
+
+# Precarga mientras se escribe: segundos sin cambios antes de consultar e hilos de fondo
+PRECARGA_ESPERA_S = float(os.getenv("VIATICOS_PRECARGA_ESPERA_S", 0.5))
+PRECARGA_WORKERS = int(os.getenv("VIATICOS_PRECARGA_WORKERS", 2))
+PRECARGA_MIN_CARACTERES = 3
+
+# Cortocircuito por proveedor: fallas seguidas para abrir y segundos hasta la sonda
+CIRCUITO_UMBRAL = int(os.getenv("VIATICOS_CIRCUITO_UMBRAL", 5))
+CIRCUITO_ESPERA_S = float(os.getenv("VIATICOS_CIRCUITO_ESPERA_S", 30))
+
+_ESTADOS_TRANSITORIOS = {"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"}
+
+
+# Consultas idénticas en curso (de cualquier sesión) comparten una sola llamada
+_vuelos = SingleFlight()
+
+
+class ProveedorError(Exception):
+    """Falla definitiva del proveedor (API key inválida, petición rechazada...)."""
+
+
+class ErrorTransitorio(ProveedorError):
+    """Falla temporal; se puede reintentar."""
+
+
+class SinRuta(ProveedorError):
+    """El proveedor respondió, pero sin distancia para el par (el mensaje dice por qué)."""
+
+
+def _transitorio(e):
+    """Convierte errores de red / HTTP 429 y 5xx en ErrorTransitorio."""
+    if isinstance(e, (requests.Timeout, requests.ConnectionError)):
+        return ErrorTransitorio(str(e))
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        codigo = e.response.status_code
+        if codigo == 429 or codigo >= 500:
+            return ErrorTransitorio(f"HTTP {codigo}")
+    return None
+
+
+# ------------ Cortocircuitos -------------
+_circuitos = {}
+_circuitos_lock = threading.Lock()
+
+
+def get_circuito(servicio):
+    """CircuitBreaker compartido por proceso para "google" u "ors"."""
+    with _circuitos_lock:
+        if servicio not in _circuitos:
+            _circuitos[servicio] = CircuitBreaker(CIRCUITO_UMBRAL, CIRCUITO_ESPERA_S)
+        return _circuitos[servicio]
+
+
+def proveedor_disponible(servicio):
+    """False mientras el circuito del servicio está abierto (se responde sin red)."""
+    return get_circuito(servicio).estado() != CircuitBreaker.ABIERTO
+
+
+def _cuenta_como_falla(e):
+    # Timeouts, conexión, 429, 5xx y estados temporales; no una API key inválida
+    return isinstance(e, ErrorTransitorio) or (isinstance(e, requests.RequestException) and _transitorio(e) is not None)
+
+
+def _metricas_circuitos():
+    with _circuitos_lock:
+        circuitos = dict(_circuitos)
+    filas = []
+    for servicio, circuito in circuitos.items():
+        filas.append(({"servicio": servicio, "dato": "abierto"}, int(circuito.estado() != CircuitBreaker.CERRADO)))
+        filas.append(({"servicio": servicio, "dato": "rechazadas"}, circuito.rechazadas))
+    return filas
+
+
+get_metricas().gauge("circuito", _metricas_circuitos, "Cortocircuitos de proveedores de distancia")
+
+
+def _get_json(url, params):
+    """
+    (estatus, respuesta) de una API de Google. El estatus se revisa dentro
+    del circuito: OVER_QUERY_LIMIT / UNKNOWN_ERROR (con HTTP 200) cuentan
+    como falla igual que un timeout o un 5xx.
+    """
+    def consultar():
+        try:
+            data = http_cliente.get_json(url, params=params)
+        except requests.RequestException as e:
+            transitorio = _transitorio(e)
+            if transitorio is not None:
+                raise transitorio from e
+            raise
+        return _revisar_estado(data), data
+
+    return get_circuito("google").llamar(consultar, _cuenta_como_falla)
+
+
+def _revisar_estado(data):
+    estado = data.get("status", "OK")
+    if estado in _ESTADOS_TRANSITORIOS:
+        raise ErrorTransitorio(estado)
+    if estado not in ("OK", "ZERO_RESULTS", "NOT_FOUND"):
+        raise ProveedorError(estado)
+    return estado
+
+
+# ------------ Google Directions -------------
+@medido("proveedor", proveedor="google")
+def google_directions_km(origin, destination, api_key):
+    params = {"origin": origin, "destination": destination, "key": api_key}
+    _, data = _get_json(GOOGLE_DIRECTIONS_URL, params)
+    if data.get("routes"):
+        meters = data["routes"][0]["legs"][0]["distance"]["value"]
+        return meters / 1000.0
+    return None
+
+
+@medido("distancia", funcion="km_google_distance")
+def km_google_distance(origin, destination, api_key):
+    try:
+        return _vuelos.do(
+            ("google",) + clave_ruta(origin, destination),
+            lambda: google_directions_km(origin, destination, api_key),
+        )
+    except Exception:
+        return None
+
+
+# ------------ Google Distance Matrix -------------
+@medido("proveedor", proveedor="google_matrix")
+def _google_matrix(origin_city, dest_city, api_key):
+    """km del par; SinRuta con el estatus de Google si no lo resolvió."""
+    params = {
+        "origins": origin_city,
+        "destinations": dest_city,
+        "units": "metric",
+        "key": api_key,
+    }
+    estado, data = _get_json(GOOGLE_MATRIX_URL, params)
+    if estado != "OK":
+        raise SinRuta(f"Respuesta API: {estado}")
+    rows = data.get("rows", [])
+    if not rows or not rows[0].get("elements"):
+        raise SinRuta("Sin elementos en la respuesta.")
+    elem = rows[0]["elements"][0]
+    if elem.get("status") != "OK":
+        raise SinRuta(f"Estatus elemento: {elem.get('status')}")
+    return elem["distance"]["value"] / 1000.0
+
+
+def google_matrix_km(origin_city, dest_city, api_key):
+    try:
+        return _google_matrix(origin_city, dest_city, api_key)
+    except SinRuta:
+        return None
+
+
+@medido("distancia", funcion="fetch_distance_google")
+def fetch_distance_google(origin_city: str, dest_city: str, api_key: str):
+    """
+    Devuelve (distancia_km, error_msg).
+    - distancia_km: float | None
+    - error_msg: str | None
+    """
+    if not api_key or not origin_city or not dest_city:
+        return None, "Falta API key o ciudades."
+    try:
+        km = _google_matrix(origin_city, dest_city, api_key)
+    except CircuitoAbierto:
+        return None, "Google no responde; se reintentará en unos segundos."
+    except SinRuta as e:
+        return None, str(e)
+    except ProveedorError as e:
+        return None, f"Respuesta API: {e}"
+    except Exception as e:
+        return None, f"Error consultando API: {e}"
+    return km, None
+
+
+# ------------ OpenRouteService -------------
+def _http_get_json(url: str, params: dict | None = None, headers: dict | None = None):
+    return get_circuito("ors").llamar(
+        lambda: http_cliente.get_json(url, params=params, headers=headers), _cuenta_como_falla)
+
+def _http_post_json(url: str, body: dict, headers: dict | None = None):
+    return get_circuito("ors").llamar(
+        lambda: http_cliente.post_json(url, body, headers=headers), _cuenta_como_falla)
+
+def geocode_ors(api_key: str, text: str):
+    params = {"api_key": api_key, "text": text, "size": 1}
+    js = _http_get_json(f"{ORS_URL}/geocode/search", params)
+    feats = js.get("features", [])
+    if not feats:
+        return None
+    coords = feats[0]["geometry"]["coordinates"]
+    return float(coords[0]), float(coords[1])
+
+@medido("distancia", funcion="driving_distance_km_ors")
+def driving_distance_km_ors(api_key: str, origin_text: str, dest_text: str):
+    return _vuelos.do(
+        ("ors",) + clave_ruta(origin_text, dest_text),
+        lambda: _driving_distance_km_ors(api_key, origin_text, dest_text),
+    )
+
+@medido("proveedor", proveedor="ors")
+def _driving_distance_km_ors(api_key: str, origin_text: str, dest_text: str):
+    # Gazetteer local primero; la red sólo en un miss (y el resultado se guarda)
+    gazetteer = get_gazetteer()
+    o = gazetteer.geocodificar(origin_text, lambda t: geocode_ors(api_key, t))
+    d = gazetteer.geocodificar(dest_text, lambda t: geocode_ors(api_key, t))
+    if not o or not d:
+        return None
+    url = f"{ORS_URL}/v2/directions/driving-car?api_key={api_key}"
+    body = {"coordinates": [[o[0], o[1]], [d[0], d[1]]]}
+    headers = {"Content-Type": "application/json"}
+    js = _http_post_json(url, body, headers)
+    routes = js.get("routes", [])
+    if not routes:
+        return None
+    meters = routes[0]["summary"]["distance"]
+    return float(meters) / 1000.0
+
+
+def ors_km(origin, destination, api_key):
+    try:
+        return driving_distance_km_ors(api_key, origin, destination)
+    except requests.RequestException as e:
+        transitorio = _transitorio(e)
+        if transitorio is not None:
+            raise transitorio from e
+        raise ProveedorError(str(e)) from e
+
+
+# ------------ Resolución concurrente -------------
+PROVEEDORES = {
+    "google": google_directions_km,
+    "google_matrix": google_matrix_km,
+    "ors": ors_km,
+}
+
+# Proveedores de la consulta cubierta, en orden de preferencia -> variable de entorno
+# de su API key (None: no necesita clave) o función que la devuelve
+CUBIERTOS = {
+    "google": "GOOGLE_MAPS_API_KEY",
+    "ors": "ORS_API_KEY",
+}
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def km_de_matriz(origen, destino, pais=""):
+    """Distancia de la matriz precalculada de sucursales, o None si no está (lectura O(1), sin red)."""
+    matriz = get_matriz_rutas()
+    if matriz is None or not matriz.aplica(pais):
+        return None
+    return matriz.km(origen, destino)
+
+
+def registrar_proveedor(nombre, fn, rate=10.0, clave=None, cubrir=True):
+    """
+    Agrega un backend de distancias: `fn(origen, destino, api_key)` devuelve
+    km o None y lanza ErrorTransitorio en fallas reintentables. `rate` son
+    peticiones por segundo. `clave` es la variable de entorno de su API key,
+    una función que la devuelve o None si no usa clave; con `cubrir` entra a
+    la consulta cubierta (después de los ya registrados).
+    """
+    PROVEEDORES[nombre] = fn
+    RATE_LIMITS.setdefault(nombre, float(rate))
+    if cubrir:
+        CUBIERTOS[nombre] = clave
+
+
+def _api_key(clave):
+    if clave is None:
+        return ""
+    return clave() if callable(clave) else os.getenv(clave, "")
+
+
+def claves_configuradas():
+    """
+    {proveedor: api_key} de los proveedores cubiertos utilizables (con clave
+    configurada o que no la necesitan), en orden de HEDGE_ORDEN o de registro.
+    """
+    claves = {}
+    for proveedor in HEDGE_ORDEN or tuple(CUBIERTOS):
+        if proveedor not in CUBIERTOS:
+            continue
+        api_key = _api_key(CUBIERTOS[proveedor])
+        if api_key or CUBIERTOS[proveedor] is None:
+            claves[proveedor] = api_key
+    return claves
+
+
+def get_rate_limiter(proveedor):
+    """Un TokenBucket por proveedor y por proceso."""
+    with _buckets_lock:
+        if proveedor not in _buckets:
+            _buckets[proveedor] = TokenBucket(RATE_LIMITS[proveedor])
+        return _buckets[proveedor]
+
+
+def distancia_km(proveedor, origen, destino, api_key, intentos=4):
+    """
+    Una consulta con limitador de tasa y hasta `intentos` intentos con backoff.
+    None si falla. Llamadas simultáneas con el mismo proveedor/origen/destino
+    comparten una.
+    """
+    fn = PROVEEDORES[proveedor]
+    limiter = get_rate_limiter(proveedor)
+
+    def intento():
+        limiter.acquire()
+        return fn(origen, destino, api_key)
+
+    try:
+        return _vuelos.do(
+            ("resolver", proveedor) + clave_ruta(origen, destino),
+            lambda: con_reintentos(intento, reintentar=(ErrorTransitorio,), intentos=intentos),
+        )
+    except Exception:
+        return None
+
+
+@medido("distancia", funcion="distancia_cacheada")
+def distancia_cacheada(proveedor, origen, destino, pais, api_key, cache=None, intentos=1):
+    """
+    Caché de rutas -> una sola consulta en vuelo por ruta -> caché. Devuelve
+    (km, desde_cache); km es None si no se pudo obtener. Por defecto un solo
+    intento, pensado para la página (el usuario está esperando).
+    """
+    km = km_de_matriz(origen, destino, pais)
+    if km is not None:
+        return km, True
+    cache = cache if cache is not None else get_route_cache()
+    km = cache.get(origen, destino, pais)
+    if km is not None:
+        return km, True
+
+    def consultar():
+        # Otra sesión pudo haberla resuelto mientras esperábamos el turno
+        km = cache.get(origen, destino, pais)
+        if km is None:
+            km = distancia_km(proveedor, origen, destino, api_key, intentos)
+            if km is not None:
+                cache.set(origen, destino, pais, km)
+        return km
+
+    return _vuelos.do(("cache", proveedor) + clave_ruta(origen, destino, pais), consultar), False
+
+
+# ------------ Consulta cubierta (hedging) -------------
+_hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+
+
+@medido("distancia", funcion="distancia_cubierta")
+def distancia_cubierta(origen, destino, claves, umbral=HEDGE_UMBRAL_S):
+    """
+    Consulta el primer proveedor de `claves` ({proveedor: api_key}, en orden
+    de preferencia) y, si no contestó en `umbral` segundos o falló, lanza el
+    siguiente. Gana la primera respuesta válida; las demás se cancelan si aún
+    no empezaron o se descartan (un hilo no se puede interrumpir: la petición
+    en curso termina sola, acotada por su timeout). Devuelve (km, proveedor)
+    o (None, None).
+    """
+    pendientes = list(claves.items())
+    en_curso = {}
+
+    def lanzar():
+        proveedor, api_key = pendientes.pop(0)
+        futuro = _hedge_pool.submit(distancia_km, proveedor, origen, destino, api_key, 1)
+        en_curso[futuro] = proveedor
+
+    if not pendientes:
+        return None, None
+    lanzar()
+    try:
+        while en_curso:
+            listos, _ = wait(en_curso, timeout=umbral if pendientes else None, return_when=FIRST_COMPLETED)
+            if not listos:
+                lanzar()  # el más lento no contestó a tiempo: respaldo
+                continue
+            for futuro in listos:
+                proveedor = en_curso.pop(futuro)
+                km = futuro.result()
+                if km is not None:
+                    return km, proveedor
+            if pendientes:
+                lanzar()  # falló sin esperar al umbral: respaldo de inmediato
+        return None, None
+    finally:
+        for futuro in en_curso:
+            futuro.cancel()
+
+
+@medido("distancia", funcion="distancia_cacheada_cubierta")
+def distancia_cacheada_cubierta(origen, destino, pais, claves, cache=None, umbral=HEDGE_UMBRAL_S):
+    """Como distancia_cacheada, pero la consulta a la red es distancia_cubierta. Devuelve (km, fuente)."""
+    km = km_de_matriz(origen, destino, pais)
+    if km is not None:
+        return km, "matriz"
+    cache = cache if cache is not None else get_route_cache()
+    km = cache.get(origen, destino, pais)
+    if km is not None:
+        return km, "cache"
+
+    def consultar():
+        km = cache.get(origen, destino, pais)
+        if km is not None:
+            return km, "cache"
+        km, proveedor = distancia_cubierta(origen, destino, claves, umbral)
+        if km is not None:
+            cache.set(origen, destino, pais, km)
+        return km, proveedor
+
+    return _vuelos.do(("cubierta",) + clave_ruta(origen, destino, pais), consultar)
+
+
+# ------------ Precarga en segundo plano -------------
+_precargas = Debouncer(PRECARGA_ESPERA_S)
+_precarga_pool = ThreadPoolExecutor(max_workers=PRECARGA_WORKERS, thread_name_prefix="precarga")
+
+
+def lugar_plausible(texto):
+    """Al menos PRECARGA_MIN_CARACTERES y alguna letra: no vale la pena consultar 'Mo' o '123'."""
+    lugar = normalizar_lugar(texto)
+    return len(lugar) >= PRECARGA_MIN_CARACTERES and any(c.isalpha() for c in lugar)
+
+
+def precargar_distancia(sesion, origen, destino, pais="", claves=None, cache=None):
+    """
+    Programa la búsqueda de origen->destino en segundo plano para que, cuando
+    el usuario la pida, ya esté en el caché (o en vuelo: la consulta del botón
+    se une a la misma). Cada `sesion` tiene a lo más una precarga pendiente;
+    un cambio antes de PRECARGA_ESPERA_S la reemplaza. True si se programó.
+    """
+    claves = claves if claves is not None else claves_configuradas()
+    o, d, _ = clave_ruta(origen, destino)
+    if not claves or not (lugar_plausible(o) and lugar_plausible(d)) or o == d:
+        _precargas.cancelar(sesion)
+        return False
+    _precargas.llamar(sesion, lambda: _precarga_pool.submit(_precargar, origen, destino, pais, claves, cache))
+    return True
+
+
+def _precargar(origen, destino, pais, claves, cache):
+    km, fuente = distancia_cacheada_cubierta(origen, destino, pais, claves, cache=cache)
+    resultado = "sin_dato" if km is None else fuente if fuente in ("cache", "matriz") else "red"
+    contar("precarga_distancia", ayuda="Precargas de distancia en segundo plano", resultado=resultado)
+
+
+def _separar_pendientes(pares, pais, cache, usar_matriz=True):
+    """Normaliza y deduplica `pares`; devuelve (pares, resueltos_en_matriz_o_cache, pendientes)."""
+    pares = [(str(o or ""), str(d or "")) for o, d in pares]
+    resueltos = {}
+    pendientes = {}
+    matriz = get_matriz_rutas() if usar_matriz else None
+    if matriz is not None and not matriz.aplica(pais):
+        matriz = None
+    for o, d in pares:
+        if not (o.strip() and d.strip()):
+            continue
+        clave = clave_ruta(o, d, pais)
+        if clave in resueltos or clave in pendientes:
+            continue
+        km = matriz.km(o, d) if matriz is not None else None
+        if km is None:
+            km = cache.get(o, d, pais)
+        if km is None:
+            pendientes[clave] = (o, d)
+        else:
+            resueltos[clave] = km
+    return pares, resueltos, pendientes
+
+
+def resolver_distancias(pares, proveedor, api_key, pais="", max_workers=MAX_WORKERS, cache=None, usar_matriz=True):
+    """
+    Distancias (km, una vía) para una lista de pares (origen, destino), en el
+    mismo orden. Los pares idénticos (tras normalizar) se consultan una sola
+    vez, los que ya están en caché no salen a la red y el resto se resuelve en
+    un pool de hilos acotado. None donde no se pudo obtener la distancia.
+    `usar_matriz=False` ignora la matriz precalculada (para reconstruirla).
+    """
+    cache = cache if cache is not None else get_route_cache()
+    pares, resueltos, pendientes = _separar_pendientes(pares, pais, cache, usar_matriz)
+
+    if pendientes:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futuros = {
+                clave: pool.submit(distancia_km, proveedor, o, d, api_key)
+                for clave, (o, d) in pendientes.items()
+            }
+            for clave, futuro in futuros.items():
+                km = futuro.result()
+                resueltos[clave] = km
+                if km is not None:
+                    o, d = pendientes[clave]
+                    cache.set(o, d, pais, km)
+
+    return [resueltos.get(clave_ruta(o, d, pais)) for o, d in pares]
+
+
+# ------------ Distance Matrix por bloques -------------
+# Límites de Google por petición: 25 orígenes, 25 destinos, 100 elementos
+MATRIX_MAX_ORIGENES = 25
+MATRIX_MAX_DESTINOS = 25
+MATRIX_MAX_ELEMENTOS = 100
+# Fracción de elementos de relleno (pares que nadie pidió) aceptable para ahorrar peticiones
+MATRIX_MAX_RELLENO = float(os.getenv("VIATICOS_MATRIX_MAX_RELLENO", 0.25))
+
+
+@medido("proveedor", proveedor="google_matrix_bloque")
+def google_matrix_bloque(origenes, destinos, api_key):
+    """Una petición Distance Matrix; devuelve {(i, j): km} sólo para elementos OK."""
+    params = {
+        "origins": "|".join(origenes),
+        "destinations": "|".join(destinos),
+        "units": "metric",
+        "key": api_key,
+    }
+    estado, data = _get_json(GOOGLE_MATRIX_URL, params)
+    if estado != "OK":
+        return {}
+    km = {}
+    for i, row in enumerate(data.get("rows", [])):
+        for j, elem in enumerate(row.get("elements", [])):
+            if elem.get("status") == "OK":
+                km[(i, j)] = elem["distance"]["value"] / 1000.0
+    return km
+
+
+def _bloques_por_origen(pendientes):
+    destinos_por_origen = {}
+    for o, d in pendientes:
+        destinos_por_origen.setdefault(o, []).append(d)
+
+    grupos = {}
+    for o, ds in destinos_por_origen.items():
+        grupos.setdefault(tuple(sorted(set(ds))), []).append(o)
+
+    bloques = []
+    for destinos, origenes in grupos.items():
+        b = min(MATRIX_MAX_DESTINOS, len(destinos))
+        a = max(1, min(MATRIX_MAX_ORIGENES, MATRIX_MAX_ELEMENTOS // b))
+        for i in range(0, len(origenes), a):
+            for j in range(0, len(destinos), b):
+                bloques.append((origenes[i:i + a], list(destinos[j:j + b])))
+    return bloques
+
+
+def _bloques_en_bandas(pendientes, a):
+    """
+    Orígenes en bandas de `a` (ordenados por sus destinos, para juntar los
+    parecidos) por la unión de los destinos de la banda, en tramos de hasta
+    100 // a. Cubre todos los pendientes con algunos elementos de relleno.
+    """
+    b = min(MATRIX_MAX_DESTINOS, MATRIX_MAX_ELEMENTOS // a)
+    destinos_por_origen = {}
+    for o, d in pendientes:
+        destinos_por_origen.setdefault(o, set()).add(d)
+    origenes = sorted(destinos_por_origen, key=lambda o: sorted(destinos_por_origen[o]))
+
+    bloques = []
+    for i in range(0, len(origenes), a):
+        banda = origenes[i:i + a]
+        # Los destinos que piden más orígenes de la banda van juntos: menos relleno
+        cuenta = Counter(d for o in banda for d in destinos_por_origen[o])
+        destinos = sorted(cuenta, key=lambda d: (-cuenta[d], d))
+        for j in range(0, len(destinos), b):
+            bloques.append((banda, destinos[j:j + b]))
+    return bloques
+
+
+def _elementos(bloques):
+    return sum(len(origenes) * len(destinos) for origenes, destinos in bloques)
+
+
+def planear_bloques(pendientes):
+    """
+    Agrupa pares pendientes en bloques orígenes × destinos que respetan los
+    límites de la API. Candidatos: bloques exactos (orígenes con el mismo
+    conjunto de destinos comparten bloque) y bandas de orígenes por la unión
+    de sus destinos, con relleno (p. ej. la diagonal de una matriz completa);
+    todos también transpuestos. Gana el plan con menos peticiones entre los
+    exactos y los de relleno <= MATRIX_MAX_RELLENO. Devuelve una lista de
+    (origenes, destinos).
+    """
+    pendientes = list(pendientes)
+    if not pendientes:
+        return []
+    transpuestos = [(d, o) for o, d in pendientes]
+    planes = [_bloques_por_origen(pendientes),
+              [(o, d) for d, o in _bloques_por_origen(transpuestos)]]
+    for a in sorted({min(MATRIX_MAX_ORIGENES, a) for a in (1, 2, 3, 4, 5, 10, 20, 25)}):
+        planes.append(_bloques_en_bandas(pendientes, a))
+        planes.append([(o, d) for d, o in _bloques_en_bandas(transpuestos, a)])
+    maximo = len(pendientes) / (1 - MATRIX_MAX_RELLENO) if MATRIX_MAX_RELLENO < 1 else float("inf")
+    validos = planes[:2] + [p for p in planes[2:] if _elementos(p) <= maximo]
+    return min(validos, key=lambda p: (len(p), _elementos(p)))
+
+
+def resolver_distancias_matriz(pares, api_key, pais="", max_workers=MAX_WORKERS, cache=None, usar_matriz=True):
+    """
+    Igual que resolver_distancias, pero empaqueta los pares pendientes en
+    peticiones Distance Matrix de hasta 100 elementos y reparte los resultados
+    a cada viaje (y al caché de rutas).
+    """
+    cache = cache if cache is not None else get_route_cache()
+    pares, resueltos, pendientes = _separar_pendientes(pares, pais, cache, usar_matriz)
+
+    # Un representante por texto normalizado, para no repetir lugares en la petición
+    nombre = {}
+    for o, d in pendientes.values():
+        nombre.setdefault(normalizar_lugar(o), o)
+        nombre.setdefault(normalizar_lugar(d), d)
+    pares_norm = [(o, d) for o, d, _ in pendientes]
+    pais_norm = normalizar_lugar(pais)
+
+    limiter = get_rate_limiter("google_matrix")
+
+    def consultar(bloque):
+        origenes, destinos = bloque
+
+        def intento():
+            limiter.acquire()
+            return google_matrix_bloque([nombre[o] for o in origenes], [nombre[d] for d in destinos], api_key)
+
+        try:
+            return bloque, con_reintentos(intento, reintentar=(ErrorTransitorio,))
+        except Exception:
+            return bloque, {}
+
+    if pares_norm:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for (origenes, destinos), km in pool.map(consultar, planear_bloques(pares_norm)):
+                for (i, j), valor in km.items():
+                    clave = (origenes[i], destinos[j], pais_norm)
+                    if clave in pendientes:
+                        resueltos[clave] = valor
+                        cache.set(*pendientes[clave], pais, valor)
+                    else:
+                        # Elemento de relleno: ya se pagó, queda en el caché
+                        cache.set(nombre[origenes[i]], nombre[destinos[j]], pais, valor)
+
+    return [resueltos.get(clave_ruta(o, d, pais)) for o, d in pares]
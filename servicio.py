@@ -0,0 +1,255 @@
+"""
+Servicio HTTP/JSON de costeo de viáticos (WSGI), para el ERP y el portal de
+solicitudes de viaje. Usa el mismo motor de cálculo y la misma búsqueda de
+distancias que la página de Streamlit. Los viajes en auto sin casetas las
+toman de la tabla de casetas (casetas.py; opcionalmente con `plazas`).
+
+    POST /viaticos   un viaje (objeto) o varios ({"viajes": [...]} o lista);
+                     ?formato=csv|parquet|arrow devuelve el lote como archivo
+                     (el CSV se transmite por bloques)
+    GET  /distancia  ?origen=...&destino=...&pais=...
+    GET  /salud
+    GET  /metricas   métricas del worker en formato de texto de Prometheus
+
+Desarrollo:   python servicio.py [puerto]
+Producción:   gunicorn -w 8 -b 0.0.0.0:8000 servicio:app
+
+Cada worker es un proceso independiente con sus propios cachés en memoria;
+el caché de rutas en SQLite (VIATICOS_CACHE_DB) se comparte entre todos.
+"""
+import json
+import os
+import sys
+from collections import namedtuple
+from functools import partial
+from urllib.parse import parse_qs
+
+from cache_rutas import get_route_cache
+from casetas import buscar_casetas
+from calculos import DEFAULTS, calcular_viaje, calcular_viaticos, normalizar_viaje
+from estimador import estimar_km
+from exportar import FORMATOS, csv_en_bloques, exportar_tabla
+from lotes import completar_casetas, completar_distancias
+from metricas import get_metricas
+from proveedores import claves_configuradas, distancia_cacheada_cubierta, resolver_distancias_matriz
+
+# ------------ Config -------------
+MAX_BODY_BYTES = int(os.getenv("VIATICOS_SERVICIO_MAX_BODY", 8 * 1024 * 1024))
+MAX_VIAJES = int(os.getenv("VIATICOS_SERVICIO_MAX_VIAJES", 50000))
+
+# Columnas de la respuesta: entradas + calculadas
+CAMPOS_RESPUESTA = list(DEFAULTS) + [
+    "rooms", "hotel_dia", "alimentos_dia", "hotel_total", "alimentos_total",
+    "km_totales", "casetas_totales", "litros", "gasolina", "transporte_total",
+    "otros_total", "total_viaticos", "detalle_transporte", "distancia_estimada",
+]
+
+
+class SolicitudInvalida(Exception):
+    pass
+
+
+# Respuesta que no es JSON: `contenido` es un iterable de bytes
+Archivo = namedtuple("Archivo", ["mime", "nombre", "contenido"])
+
+
+# ------------ Distancias -------------
+def _api_key():
+    return os.getenv("GOOGLE_MAPS_API_KEY", "")
+
+
+def buscar_distancia(origen, destino, pais=""):
+    """
+    (km, estimada): caché / Google u ORS (cubiertos) si hay API keys; si no,
+    estimador local. km None si no hay dato.
+    """
+    claves = claves_configuradas()
+    if claves:
+        km, _ = distancia_cacheada_cubierta(origen, destino, pais, claves)
+    else:
+        km = get_route_cache().get(origen, destino, pais)
+    if km is not None:
+        return km, False
+    km = estimar_km(origen, destino)
+    return km, km is not None
+
+
+# Sobre un viaje ya normalizado (normalizar_viaje)
+def _con_ruta(fila):
+    return fila["medio"] == "Auto" and bool(fila["origen"].strip()) and bool(fila["destino"].strip())
+
+
+def _falta_distancia(fila):
+    return _con_ruta(fila) and fila["distancia_km"] <= 0
+
+
+def _faltan_casetas(fila):
+    return _con_ruta(fila) and fila["casetas"] <= 0
+
+
+# ------------ Costeo -------------
+def costear_viaje(viaje):
+    """Un viaje (dict) -> dict de respuesta. Camino rápido sin pandas."""
+    try:
+        fila = normalizar_viaje(viaje)
+    except (TypeError, ValueError) as e:
+        raise SolicitudInvalida(f"Viaje inválido: {e}") from e
+    estimada = False
+    if _falta_distancia(fila):
+        km, estimada = buscar_distancia(fila["origen"], fila["destino"], fila["pais"])
+        if km is not None:
+            fila["distancia_km"] = round(km, 2)
+    if _faltan_casetas(fila):
+        costo = buscar_casetas(fila["origen"], fila["destino"], fila["pais"], viaje.get("plazas", ""))
+        if costo is not None:
+            fila["casetas"] = costo
+    r = calcular_viaje(fila)
+    r["distancia_estimada"] = estimada
+    return {k: r[k] for k in CAMPOS_RESPUESTA}
+
+
+def costear_tabla(viajes):
+    """Lista de viajes -> DataFrame con CAMPOS_RESPUESTA (motor vectorizado)."""
+    api_key = _api_key()
+    resolver = partial(resolver_distancias_matriz, api_key=api_key) if api_key else None
+    try:
+        res = calcular_viaticos(completar_casetas(completar_distancias(viajes, resolver=resolver)), con_detalle=True)
+    except (TypeError, ValueError) as e:
+        raise SolicitudInvalida(f"Viajes inválidos: {e}") from e
+    return res[CAMPOS_RESPUESTA]
+
+
+def costear_viajes(viajes):
+    """Lista de viajes -> lista de dicts de respuesta."""
+    return costear_tabla(viajes).to_dict("records")
+
+
+# ------------ WSGI -------------
+def _json_default(valor):
+    # Escalares de NumPy que pudieran quedar en los registros
+    if hasattr(valor, "item"):
+        return valor.item()
+    raise TypeError(f"No serializable: {type(valor).__name__}")
+
+
+def _responder(start_response, estado, cuerpo):
+    datos = json.dumps(cuerpo, ensure_ascii=False, allow_nan=False, default=_json_default).encode("utf-8")
+    start_response(estado, [
+        ("Content-Type", "application/json; charset=utf-8"),
+        ("Content-Length", str(len(datos))),
+    ])
+    return [datos]
+
+
+def _responder_archivo(start_response, archivo):
+    encabezados = [
+        ("Content-Type", archivo.mime),
+        ("Content-Disposition", f'attachment; filename="{archivo.nombre}"'),
+    ]
+    if isinstance(archivo.contenido, bytes):
+        encabezados.append(("Content-Length", str(len(archivo.contenido))))
+        start_response("200 OK", encabezados)
+        return [archivo.contenido]
+    start_response("200 OK", encabezados)
+    return archivo.contenido
+
+
+def _leer_json(environ):
+    try:
+        largo = int(environ.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        largo = 0
+    if largo <= 0:
+        raise SolicitudInvalida("Cuerpo vacío")
+    if largo > MAX_BODY_BYTES:
+        raise SolicitudInvalida(f"Cuerpo mayor a {MAX_BODY_BYTES} bytes")
+    try:
+        return json.loads(environ["wsgi.input"].read(largo), parse_constant=_constante_invalida)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise SolicitudInvalida(f"JSON inválido: {e}") from e
+
+
+def _constante_invalida(nombre):
+    # json.loads acepta NaN e Infinity, que no son JSON válido ni montos
+    raise SolicitudInvalida(f"JSON inválido: {nombre} no es un número válido")
+
+
+def _viaticos(environ):
+    formato = parse_qs(environ.get("QUERY_STRING", "")).get("formato", ["json"])[0]
+    if formato != "json" and formato not in FORMATOS:
+        raise SolicitudInvalida(f"Formato no soportado: {formato}")
+    cuerpo = _leer_json(environ)
+    if isinstance(cuerpo, dict) and "viajes" in cuerpo:
+        cuerpo = cuerpo["viajes"]
+    if isinstance(cuerpo, dict):
+        if formato == "json":
+            return {"viaje": costear_viaje(cuerpo)}
+        cuerpo = [cuerpo]
+    if not isinstance(cuerpo, list) or not all(isinstance(v, dict) for v in cuerpo):
+        raise SolicitudInvalida("Se espera un objeto o una lista de objetos")
+    if len(cuerpo) > MAX_VIAJES:
+        raise SolicitudInvalida(f"Máximo {MAX_VIAJES} viajes por solicitud")
+    if formato != "json":
+        if not cuerpo:
+            raise SolicitudInvalida("Sin viajes")
+        _, extension, mime = FORMATOS[formato]
+        tabla = costear_tabla(cuerpo)
+        # El CSV sale por bloques mientras se envía; los demás formatos son binarios completos
+        contenido = csv_en_bloques(tabla) if formato == "csv" else exportar_tabla(tabla, formato)
+        return Archivo(mime, f"viaticos{extension}", contenido)
+    if not cuerpo:
+        return {"viajes": []}
+    return {"viajes": costear_viajes(cuerpo)}
+
+
+def _distancia(environ):
+    qs = parse_qs(environ.get("QUERY_STRING", ""))
+    origen = qs.get("origen", [""])[0].strip()
+    destino = qs.get("destino", [""])[0].strip()
+    pais = qs.get("pais", [""])[0].strip()
+    if not origen or not destino:
+        raise SolicitudInvalida("Faltan origen y/o destino")
+    km, estimada = buscar_distancia(origen, destino, pais)
+    return {"origen": origen, "destino": destino, "pais": pais,
+            "distancia_km": None if km is None else round(km, 2), "estimada": estimada}
+
+
+def _metricas(environ):
+    return Archivo("text/plain; version=0.0.4; charset=utf-8", "metricas.prom",
+                   get_metricas().texto_prometheus().encode("utf-8"))
+
+
+RUTAS = {
+    ("POST", "/viaticos"): _viaticos,
+    ("GET", "/distancia"): _distancia,
+    ("GET", "/salud"): lambda environ: {"ok": True},
+    ("GET", "/metricas"): _metricas,
+}
+
+
+def app(environ, start_response):
+    metodo = environ.get("REQUEST_METHOD", "GET")
+    ruta = environ.get("PATH_INFO", "/").rstrip("/") or "/"
+    manejador = RUTAS.get((metodo, ruta))
+    if manejador is None:
+        if any(r == ruta for _, r in RUTAS):
+            return _responder(start_response, "405 Method Not Allowed", {"error": "Método no permitido"})
+        return _responder(start_response, "404 Not Found", {"error": "No encontrado"})
+    try:
+        with get_metricas().span("servicio", ruta=ruta):
+            respuesta = manejador(environ)
+        if isinstance(respuesta, Archivo):
+            return _responder_archivo(start_response, respuesta)
+        return _responder(start_response, "200 OK", respuesta)
+    except SolicitudInvalida as e:
+        return _responder(start_response, "400 Bad Request", {"error": str(e)})
+    except Exception as e:
+        return _responder(start_response, "500 Internal Server Error", {"error": f"Error interno: {e}"})
+
+
+if __name__ == "__main__":
+    from wsgiref.simple_server import make_server
+
+    puerto = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    print(f"Servicio de viáticos en http://127.0.0.1:{puerto}")
+    make_server("", puerto, app).serve_forever()
@@ -1,59 +1,23 @@
 
-import json
 import math
-from io import BytesIO
-from urllib import request, parse, error
 
 import pandas as pd
+import requests
 import streamlit as st
-from PIL import Image
-
-
-def _http_get_json(url: str, headers: dict | None = None):
-    req = request.Request(url, headers=headers or {})
-    with request.urlopen(req, timeout=20) as resp:
-        return json.loads(resp.read().decode("utf-8"))
-
-def _http_post_json(url: str, body: dict, headers: dict | None = None):
-    data = json.dumps(body).encode("utf-8")
-    req = request.Request(url, data=data, headers=headers or {}, method="POST")
-    with request.urlopen(req, timeout=20) as resp:
-        return json.loads(resp.read().decode("utf-8"))
-
-def geocode_ors(api_key: str, text: str):
-    q = parse.urlencode({"api_key": api_key, "text": text, "size": 1})
-    url = f"https://api.openrouteservice.org/geocode/search?{q}"
-    js = _http_get_json(url)
-    feats = js.get("features", [])
-    if not feats:
-        return None
-    coords = feats[0]["geometry"]["coordinates"]
-    return float(coords[0]), float(coords[1])
-
-def driving_distance_km_ors(api_key: str, origin_text: str, dest_text: str):
-    o = geocode_ors(api_key, origin_text)
-    d = geocode_ors(api_key, dest_text)
-    if not o or not d:
-        return None
-    url = f"https://api.openrouteservice.org/v2/directions/driving-car?api_key={api_key}"
-    body = {"coordinates": [[o[0], o[1]], [d[0], d[1]]]}
-    headers = {"Content-Type": "application/json"}
-    js = _http_post_json(url, body, headers)
-    routes = js.get("routes", [])
-    if not routes:
-        return None
-    meters = routes[0]["summary"]["distance"]
-    return float(meters) / 1000.0
+
+from activos import cargar_logo
+from cache_rutas import get_route_cache
+from concurrencia import CircuitoAbierto
+from estimador import estimar_km
+from exportar import plantilla_reporte
+from proveedores import driving_distance_km_ors
 
 st.set_page_config(page_title="Calculadora de Viáticos", page_icon="💼", layout="centered")
 
-HAS_LOGO = False
-try:
-    logo = Image.open("logo.png")
-    st.image(logo, width=220)
-    HAS_LOGO = True
-except Exception:
-    pass
+logo = cargar_logo("logo.png", ancho=220)
+HAS_LOGO = logo is not None
+if HAS_LOGO:
+    st.image(logo.display_png, width=220)
 
 st.title("💼 Calculadora de Viáticos")
 
@@ -103,8 +67,17 @@ if st.button("🔎 Obtener distancia automáticamente"):
             else:
                 st.session_state.distancia_km = round(dist_km, 1)
                 st.success(f"Distancia detectada (una vía): {st.session_state.distancia_km:,.1f} km")
-        except error.HTTPError as e:
-            st.warning(f"No se pudo obtener la distancia (HTTP {e.code}). Verifica la API Key y vuelve a intentar.")
+        except CircuitoAbierto:
+            # ORS caído: no se espera el timeout; caché de rutas o estimación local
+            origen, destino = st.session_state.origen.strip(), st.session_state.destino.strip()
+            km = get_route_cache().get(origen, destino) or estimar_km(origen, destino)
+            if km is None:
+                st.warning("OpenRouteService no responde por ahora. Ingresa la distancia manualmente.")
+            else:
+                st.session_state.distancia_km = round(km, 1)
+                st.info(f"OpenRouteService no responde; distancia aproximada (una vía): {km:,.1f} km. Ajusta si es necesario.")
+        except requests.HTTPError as e:
+            st.warning(f"No se pudo obtener la distancia (HTTP {e.response.status_code}). Verifica la API Key y vuelve a intentar.")
         except Exception:
             st.warning("No se pudo obtener la distancia. Intenta de nuevo o ingresa la distancia manualmente.")
 
@@ -148,12 +121,6 @@ c3.metric("Transporte total", f"${transporte_total:,.2f}")
 
 st.success(f"**Total de viáticos: ${total_viaticos:,.2f}**")
 
-def auto_fit_columns(worksheet, dataframe):
-    for idx, col in enumerate(dataframe.columns):
-        series = dataframe[col].astype(str)
-        max_len = max(len(str(col)), series.map(len).max())
-        worksheet.set_column(idx, idx, min(max_len + 2, 60))
-
 if st.button("🗎 Descargar resultado en Excel"):
     data = {
         "Días de viaje": [st.session_state.dias],
@@ -181,38 +148,12 @@ if st.button("🗎 Descargar resultado en Excel"):
     }
     df = pd.DataFrame(data)
 
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        startrow = 6
-        df.to_excel(writer, index=False, sheet_name="Viaticos", startrow=startrow)
-        ws = writer.sheets["Viaticos"]
-        book = writer.book
-
-        title_fmt = book.add_format({
-            "bold": True, "font_size": 20, "align": "left", "valign": "vcenter"
-        })
-        subtitle_fmt = book.add_format({
-            "italic": True, "font_size": 10, "font_color": "#555555"
-        })
-        header_fmt = book.add_format({
-            "bold": True, "bg_color": "#F2F2F2", "border": 1
-        })
-
-        try:
-            ws.insert_image("A1", "logo.png", {"x_scale": 0.4, "y_scale": 0.4})
-        except Exception:
-            pass
-        ws.merge_range("C1:H2", "Reporte de Viáticos", title_fmt)
-        ws.write("C3", "Generado por Calculadora de Viáticos", subtitle_fmt)
-
-        for col_num in range(len(df.columns)):
-            ws.write(startrow, col_num, df.columns[col_num], header_fmt)
-
-        auto_fit_columns(ws, df)
+    # Layout de marca (logo, título, formatos) definido una vez por proceso
+    excel = plantilla_reporte(df.columns).a_bytes(df)
 
     st.download_button(
         label="Descargar Excel",
-        data=output.getvalue(),
+        data=excel,
         file_name="viaticos.xlsx",
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
     )
@@ -1,67 +1,14 @@
 
 import math
 from io import BytesIO
-import json
 
 import pandas as pd
 import streamlit as st
 
-# ---------- Utilidades ----------
-def fetch_distance_google(origin_city: str, dest_city: str, api_key: str):
-    """
-    Devuelve (distancia_km, error_msg).
-    - distancia_km: float | None
-    - error_msg: str | None
-    Maneja falta de 'requests' o errores de API sin romper la app.
-    """
-    if not api_key or not origin_city or not dest_city:
-        return None, "Falta API key o ciudades."
-
-    try:
-        import requests  # import local para no requerirlo si no se usa
-    except Exception:
-        return None, "El módulo 'requests' no está instalado. Agrégalo a requirements.txt si deseas usar la búsqueda automática."
-
-    try:
-        url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-        params = {
-            "origins": origin_city,
-            "destinations": dest_city,
-            "units": "metric",
-            "key": api_key,
-        }
-        resp = requests.get(url, params=params, timeout=12)
-        data = resp.json()
-        if data.get("status") != "OK":
-            return None, f"Respuesta API: {data.get('status', 'desconocido')}"
-        rows = data.get("rows", [])
-        if not rows or not rows[0].get("elements"):
-            return None, "Sin elementos en la respuesta."
-        elem = rows[0]["elements"][0]
-        if elem.get("status") != "OK":
-            return None, f"Estatus elemento: {elem.get('status')}"
-        meters = elem["distance"]["value"]
-        return meters / 1000.0, None
-    except Exception as e:
-        return None, f"Error consultando API: {e}"
-
-
-def autosize_columns(writer, df, sheet_name):
-    """Ajusta el ancho de columnas en XlsxWriter según el contenido."""
-    workbook  = writer.book
-    worksheet = writer.sheets[sheet_name]
-
-    for idx, col in enumerate(df.columns):
-        # ancho por nombre de columna
-        max_len = len(str(col))
-        # ancho por celdas
-        for val in df[col].astype(str):
-            max_len = max(max_len, len(val))
-        # margen
-        width = max_len + 2
-        worksheet.set_column(idx, idx, width)
-
+from exportar import auto_ajustar_columnas
+from proveedores import fetch_distance_google
 
+# ---------- Utilidades ----------
 def reset_form():
     """Borra todo el session_state y recarga la app."""
     st.session_state.clear()
@@ -207,7 +154,7 @@ if st.button("Calcular viáticos"):
     output = BytesIO()
     with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
         df.to_excel(writer, index=False, sheet_name="Viaticos")
-        autosize_columns(writer, df, "Viaticos")
+        auto_ajustar_columnas(writer, df, "Viaticos")
 
     st.download_button(
         label="🗎 Descargar resultado en Excel",
@@ -2,11 +2,13 @@
 import os
 import math
 from io import BytesIO
-import requests
 import pandas as pd
 import streamlit as st
 from PIL import Image
 
+from exportar import auto_ajustar_columnas
+from proveedores import km_google_distance
+
 # ------------ Config -------------
 APP_TITLE = "💼 Calculadora de Viáticos"
 LOGO_PATH = "logo.png"
@@ -40,29 +42,6 @@ def reset_form():
     # Usar update con dict para reestablecer valores de widgets
     st.session_state.update(DEFAULTS)
 
-def km_google_distance(origin, destination, api_key):
-    try:
-        url = "https://maps.googleapis.com/maps/api/directions/json"
-        params = {"origin": origin, "destination": destination, "key": api_key}
-        r = requests.get(url, params=params, timeout=15)
-        r.raise_for_status()
-        data = r.json()
-        if data.get("routes"):
-            meters = data["routes"][0]["legs"][0]["distance"]["value"]
-            return meters / 1000.0
-    except Exception:
-        return None
-    return None
-
-def auto_ajustar_columnas(writer, df, sheet_name):
-    ws = writer.sheets[sheet_name]
-    for idx, col in enumerate(df.columns):
-        try:
-            max_len = max([len(str(x)) for x in df[col].tolist()] + [len(col)])
-        except ValueError:
-            max_len = len(col)
-        ws.set_column(idx, idx, min(max_len + 2, 60))
-
 # ------------ UI -------------
 st.set_page_config(page_title=APP_TITLE, layout="centered")
 
@@ -1,204 +1,306 @@
 
 import os
-import math
-from io import BytesIO
-import requests
-import pandas as pd
+import time
+import uuid
+from functools import partial
+from pathlib import Path
 import streamlit as st
-from PIL import Image
+
+from activos import cargar_logo
+from cache_rutas import get_route_cache
+from casetas import buscar_casetas
+from calculos import DEFAULTS, MEDIOS, NOTA_ESTIMADA, calcular_viaje, tabla_viaje
+from estimador import estimar_km
+from exportar import FORMATOS, exportar_tabla, formatos_disponibles
+from geocodificacion import get_gazetteer
+from lotes import costear_archivo
+from metricas import get_metricas, medido, span
+import panel_metricas
+from proveedores import (claves_configuradas, distancia_cacheada_cubierta, precargar_distancia, proveedor_disponible,
+                         resolver_distancias_matriz)
+
+_inicio_rerun = time.perf_counter()
 
 # ------------ Config -------------
 APP_TITLE = "💼 Calculadora de Viáticos"
 LOGO_PATH = "logo.png"
 
-DEFAULTS = {
-    "dias": 1,
-    "hospedaje": 0.0,
-    "alimentacion": 0.0,
-    "personas": 1,
-    "pers_por_hab": 1,
-    "medio": "Auto",
-    "ida_vuelta": True,
-    "precio_gas": 25.0,
-    "km_litro": 12.0,
-    "distancia_km": 0.0,
-    "casetas": 0.0,
-    "pais": "Mexico",
-    "origen": "",
-    "destino": "",
-    "otros": 0.0,
-    "costo_boleto": 0.0,
-    "transporte_otro": 0.0
-}
+# Resultado calculado que comparten las secciones (fragmentos)
+RESULTADO_KEY = "_resultado"
+RERUN_APP_KEY = "_rerun_app"
+SESION_KEY = "_sesion"
+# True si distancia_km la puso el estimador local (se marca en el resultado y el archivo)
+ESTIMADA_KEY = "_distancia_estimada"
 
 # ------------ Helpers -------------
 def ensure_defaults():
     for k, v in DEFAULTS.items():
         st.session_state.setdefault(k, v)
+    st.session_state.setdefault(SESION_KEY, uuid.uuid4().hex)
+
+def precargar_ruta():
+    # Al editar origen/destino/país: la distancia se busca en segundo plano y queda en el caché
+    s = st.session_state
+    precargar_distancia(s[SESION_KEY], s["origen"], s["destino"], s["pais"])
+
+def sugerir_lugar(campo):
+    # Ciudades del gazetteer que empiezan con lo escrito, si aún no es una ciudad conocida
+    texto = st.session_state[campo]
+    if not texto.strip() or get_gazetteer().buscar(texto) is not None:
+        return
+    opciones = get_gazetteer().sugerencias(texto, limite=5)
+    if opciones:
+        st.pills("Sugerencias", opciones, key=f"_sugerencia_{campo}", on_change=elegir_lugar, args=(campo,),
+                 label_visibility="collapsed")
+
+def elegir_lugar(campo):
+    eleccion = st.session_state[f"_sugerencia_{campo}"]
+    if eleccion:
+        st.session_state[campo] = eleccion
+        precargar_ruta()
 
 def reset_form():
     st.session_state.update(DEFAULTS)
+    st.session_state.pop(RESULTADO_KEY, None)
+    st.session_state.pop(ESTIMADA_KEY, None)
     st.rerun()
 
-def km_google_distance(origin, destination, api_key):
-    try:
-        url = "https://maps.googleapis.com/maps/api/directions/json"
-        params = {"origin": origin, "destination": destination, "key": api_key}
-        r = requests.get(url, params=params, timeout=15)
-        r.raise_for_status()
-        data = r.json()
-        if data.get("routes"):
-            meters = data["routes"][0]["legs"][0]["distance"]["value"]
-            return meters / 1000.0
-    except Exception:
-        return None
-    return None
-
-def auto_ajustar_columnas(writer, df, sheet_name):
-    ws = writer.sheets[sheet_name]
-    for idx, col in enumerate(df.columns):
-        try:
-            max_len = max([len(str(x)) for x in df[col].tolist()] + [len(col)])
-        except ValueError:
-            max_len = len(col)
-        ws.set_column(idx, idx, min(max_len + 2, 60))
+def exportar_viaje(resultado, formato):
+    return exportar_tabla(tabla_viaje(resultado), formato)
+
+def etiqueta_formato(formato):
+    return FORMATOS[formato][0]
+
+# ------------ Estado entre secciones -------------
+# Cada sección es un st.fragment: un cambio sólo re-ejecuta su propia sección.
+# Si hay un resultado en pantalla y cambia una entrada, el resultado queda
+# viejo; se descarta y se pide un rerun completo para refrescar la página.
+def invalidar_resultado():
+    if st.session_state.pop(RESULTADO_KEY, None) is not None:
+        st.session_state[RERUN_APP_KEY] = True
+
+def ajustar_distancia():
+    # Capturada a mano: ya no es la del estimador
+    st.session_state[ESTIMADA_KEY] = False
+    invalidar_resultado()
+
+def cambiar_medio():
+    # Cambian los campos de transporte: el resultado ya no vale y siempre hay rerun completo
+    st.session_state.pop(RESULTADO_KEY, None)
+    st.session_state[RERUN_APP_KEY] = True
+
+def rerun_app_si_pendiente():
+    if st.session_state.pop(RERUN_APP_KEY, False):
+        st.rerun(scope="app")
 
 # ------------ UI -------------
 st.set_page_config(page_title=APP_TITLE, layout="centered")
 
-# Logo
-if os.path.exists(LOGO_PATH):
-    try:
-        st.image(Image.open(LOGO_PATH), width=220)
-    except Exception:
-        pass
+# Panel oculto: ?admin=<VIATICOS_ADMIN_TOKEN>
+if panel_metricas.es_admin():
+    panel_metricas.mostrar()
+    st.stop()
+
+# Logo (decodificado una vez por proceso)
+with span("logo"):
+    logo = cargar_logo(LOGO_PATH, ancho=220)
+if logo is not None:
+    st.image(logo.display_png, width=220)
 
 st.title(APP_TITLE)
 
 ensure_defaults()
 
-# Datos base
-colA, colB = st.columns(2)
-with colA:
-    st.number_input("Días de viaje", min_value=1, key="dias")
-    st.number_input("Hospedaje por día ($) por habitación", min_value=0.0, step=50.0, key="hospedaje")
-    st.number_input("Alimentación por día ($) por persona", min_value=0.0, step=20.0, key="alimentacion")
-with colB:
-    st.number_input("Número de personas", min_value=1, key="personas")
-    st.number_input("Personas por habitación", min_value=1, key="pers_por_hab")
-    st.selectbox("Medio de transporte", ["Auto", "Avión", "Otro"], key="medio")
+@st.fragment
+@medido("fragmento", seccion="datos_base")
+def seccion_datos_base():
+    colA, colB = st.columns(2)
+    with colA:
+        st.number_input("Días de viaje", min_value=1, key="dias", on_change=invalidar_resultado)
+        st.number_input("Hospedaje por día ($) por habitación", min_value=0.0, step=50.0, key="hospedaje",
+                        on_change=invalidar_resultado)
+        st.number_input("Alimentación por día ($) por persona", min_value=0.0, step=20.0, key="alimentacion",
+                        on_change=invalidar_resultado)
+    with colB:
+        st.number_input("Número de personas", min_value=1, key="personas", on_change=invalidar_resultado)
+        st.number_input("Personas por habitación", min_value=1, key="pers_por_hab", on_change=invalidar_resultado)
+        st.selectbox("Medio de transporte", MEDIOS, key="medio", on_change=cambiar_medio)
+    rerun_app_si_pendiente()
 
-st.divider()
 
-# Transporte
-transporte_total = 0.0
-detalle_transporte = ""
-
-if st.session_state["medio"] == "Auto":
-    st.subheader("Transporte: Auto")
-    st.number_input("Precio gasolina ($/L)", min_value=0.0, step=0.5, key="precio_gas")
-    st.number_input("Rendimiento del vehículo (km/L)", min_value=0.1, step=0.5, key="km_litro")
-
-    st.text_input("País (solo para referencia)", key="pais")
-    st.text_input("Ciudad de origen", key="origen")
-    st.text_input("Ciudad de destino", key="destino")
-
-    if st.button("🔎 Obtener distancia automáticamente", use_container_width=True):
-        api_key = os.getenv("GOOGLE_MAPS_API_KEY", "")
-        if api_key and st.session_state["origen"] and st.session_state["destino"]:
-            km = km_google_distance(st.session_state["origen"], st.session_state["destino"], api_key)
-            if km is None:
-                st.warning("No se pudo obtener la distancia. Verifica la API Key o las ciudades.")
-            else:
+@st.fragment
+@medido("fragmento", seccion="transporte")
+def seccion_transporte():
+    if st.session_state["medio"] == "Auto":
+        st.subheader("Transporte: Auto")
+        st.number_input("Precio gasolina ($/L)", min_value=0.0, step=0.5, key="precio_gas",
+                        on_change=invalidar_resultado)
+        st.number_input("Rendimiento del vehículo (km/L)", min_value=0.1, step=0.5, key="km_litro",
+                        on_change=invalidar_resultado)
+
+        st.text_input("País (solo para referencia)", key="pais", on_change=precargar_ruta)
+        st.text_input("Ciudad de origen", key="origen", on_change=precargar_ruta)
+        sugerir_lugar("origen")
+        st.text_input("Ciudad de destino", key="destino", on_change=precargar_ruta)
+        sugerir_lugar("destino")
+
+        if st.button("🔎 Obtener distancia automáticamente", use_container_width=True):
+            claves = claves_configuradas()
+            origen, destino, pais = st.session_state["origen"], st.session_state["destino"], st.session_state["pais"]
+            km = None
+            if origen and destino:
+                if claves:
+                    # Caché compartido; en un miss, una sola consulta en vuelo por ruta entre todas las sesiones.
+                    # Con Google y ORS configurados, si el primero tarda se lanza el otro y gana el más rápido.
+                    km, _ = distancia_cacheada_cubierta(origen, destino, pais, claves)
+                else:
+                    km = get_route_cache().get(origen, destino, pais)
+            if km is not None:
                 st.session_state["distancia_km"] = round(km, 2)
+                st.session_state[ESTIMADA_KEY] = False
+                invalidar_resultado()
                 st.success(f"Distancia detectada: {km:.2f} km (una vía). Ajusta si es necesario.")
-        else:
-            st.warning("Agrega tu GOOGLE_MAPS_API_KEY como variable de entorno en Streamlit Cloud y completa origen/destino.")
-
-    st.number_input("Distancia detectada/ajustada (km) una vía", min_value=0.0, key="distancia_km")
-    st.number_input("Casetas (costo) una vía ($)", min_value=0.0, step=10.0, key="casetas")
-    st.toggle("Calcular ida y vuelta", key="ida_vuelta")
-
-    factor = 2 if st.session_state["ida_vuelta"] else 1
-    km_totales = st.session_state["distancia_km"] * factor
-    casetas_totales = st.session_state["casetas"] * factor
-
-    litros = km_totales / st.session_state["km_litro"] if st.session_state["km_litro"] > 0 else 0.0
-    gasolina = litros * st.session_state["precio_gas"]
-    transporte_total = gasolina + casetas_totales
-    detalle_transporte = f"Auto: {km_totales:.0f} km, {litros:.1f} L x ${st.session_state['precio_gas']:.2f} + casetas ${casetas_totales:.2f}"
-
-elif st.session_state["medio"] == "Avión":
-    st.subheader("Transporte: Avión")
-    st.number_input("Costo de boleto por persona ($) una vía", min_value=0.0, step=100.0, key="costo_boleto")
-    st.toggle("Calcular ida y vuelta", key="ida_vuelta")
-    factor = 2 if st.session_state["ida_vuelta"] else 1
-    transporte_total = st.session_state["costo_boleto"] * st.session_state["personas"] * factor
-    detalle_transporte = f"Avión: ${st.session_state['costo_boleto']:.2f} x {st.session_state['personas']} persona(s) x {factor} vía(s)"
-
-else:
-    st.subheader("Transporte: Otro")
-    st.number_input("Transporte total ($)", min_value=0.0, step=50.0, key="transporte_otro")
-    transporte_total = st.session_state["transporte_otro"]
-    detalle_transporte = "Otro"
+            else:
+                if claves and not any(proveedor_disponible(p) for p in claves):
+                    st.caption("Los proveedores de mapas no están respondiendo; se usa la estimación local hasta que se recuperen.")
+                # Respaldo local sin red: línea recta x factor de circuito
+                km_aprox = estimar_km(origen, destino) if origen and destino else None
+                if km_aprox is not None:
+                    st.session_state["distancia_km"] = round(km_aprox, 2)
+                    st.session_state[ESTIMADA_KEY] = True
+                    invalidar_resultado()
+                    st.info(f"Distancia aproximada: {km_aprox:.2f} km (una vía, estimada sin conexión). Ajusta si es necesario.")
+                elif claves and origen and destino:
+                    st.warning("No se pudo obtener la distancia. Verifica la API Key o las ciudades.")
+                else:
+                    st.warning("Agrega tu GOOGLE_MAPS_API_KEY (u ORS_API_KEY) como variable de entorno en Streamlit Cloud y completa origen/destino.")
+            # Casetas de la tabla si la ruta está y aún no se capturaron
+            costo = buscar_casetas(origen, destino, pais) if origen and destino and not st.session_state["casetas"] else None
+            if costo:
+                st.session_state["casetas"] = round(costo, 2)
+                invalidar_resultado()
+                st.caption(f"Casetas según la tabla: ${costo:,.2f} una vía. Ajusta si es necesario.")
+
+        st.number_input("Distancia detectada/ajustada (km) una vía", min_value=0.0, key="distancia_km",
+                        on_change=ajustar_distancia)
+        st.number_input("Casetas (costo) una vía ($)", min_value=0.0, step=10.0, key="casetas",
+                        on_change=invalidar_resultado)
+        st.toggle("Calcular ida y vuelta", key="ida_vuelta", on_change=invalidar_resultado)
+
+    elif st.session_state["medio"] == "Avión":
+        st.subheader("Transporte: Avión")
+        st.number_input("Costo de boleto por persona ($) una vía", min_value=0.0, step=100.0, key="costo_boleto",
+                        on_change=invalidar_resultado)
+        st.toggle("Calcular ida y vuelta", key="ida_vuelta", on_change=invalidar_resultado)
+
+    else:
+        st.subheader("Transporte: Otro")
+        st.number_input("Transporte total ($)", min_value=0.0, step=50.0, key="transporte_otro",
+                        on_change=invalidar_resultado)
+
+    st.divider()
+    st.number_input("Otros gastos ($)", min_value=0.0, step=50.0, key="otros", on_change=invalidar_resultado)
+    rerun_app_si_pendiente()
+
+
+@st.fragment
+@medido("fragmento", seccion="resultados")
+def seccion_resultados():
+    # Cálculos principales (mismo motor que el costeo por lotes), sólo al pedirlos
+    if st.button("Calcular viáticos", type="primary", use_container_width=True):
+        r = calcular_viaje(st.session_state)
+        r["distancia_estimada"] = r["medio"] == "Auto" and st.session_state.get(ESTIMADA_KEY, False)
+        st.session_state[RESULTADO_KEY] = r
+    r = st.session_state.get(RESULTADO_KEY)
+    if r is None:
+        return
 
-st.divider()
-st.number_input("Otros gastos ($)", min_value=0.0, step=50.0, key="otros")
-
-# Cálculos principales
-rooms = math.ceil(st.session_state["personas"] / st.session_state["pers_por_hab"]) if st.session_state["pers_por_hab"] > 0 else st.session_state["personas"]
-hotel_dia = st.session_state["hospedaje"] * rooms
-alimentos_dia = st.session_state["alimentacion"] * st.session_state["personas"]
-hotel_total = st.session_state["dias"] * hotel_dia
-alimentos_total = st.session_state["dias"] * alimentos_dia
-otros_total = st.session_state["otros"]
-total_viaticos = hotel_total + alimentos_total + transporte_total + otros_total
-
-if st.button("Calcular viáticos", type="primary", use_container_width=True):
     # ---- Desglose en pantalla ----
     st.subheader("Desglose final")
     col1, col2, col3, col4, col5 = st.columns(5)
-    col1.metric("Hotel total", f"${hotel_total:,.2f}")
-    col2.metric("Comidas total", f"${alimentos_total:,.2f}")
-    col3.metric("Transporte total", f"${transporte_total:,.2f}")
-    col4.metric("Otros", f"${otros_total:,.2f}")
-    col5.metric("TOTAL", f"${total_viaticos:,.2f}")
+    col1.metric("Hotel total", f"${r['hotel_total']:,.2f}")
+    col2.metric("Comidas total", f"${r['alimentos_total']:,.2f}")
+    col3.metric("Transporte total", f"${r['transporte_total']:,.2f}")
+    col4.metric("Otros", f"${r['otros_total']:,.2f}")
+    col5.metric("TOTAL", f"${r['total_viaticos']:,.2f}")
 
     with st.expander("Detalles adicionales"):
-        st.write(f"- Habitaciones requeridas: **{rooms}**")
-        st.write(f"- Hospedaje por día (todas las hab.): **${hotel_dia:,.2f}**")
-        st.write(f"- Alimentación por día (todas las personas): **${alimentos_dia:,.2f}**")
-        st.write(f"- Transporte: {detalle_transporte}")
-
-    # ---- DataFrame para Excel ----
-    df = pd.DataFrame([{
-        "Días de viaje": st.session_state["dias"],
-        "Personas": st.session_state["personas"],
-        "Personas por habitación": st.session_state["pers_por_hab"],
-        "Habitaciones (calc)": rooms,
-        "Hospedaje por día (hab)": st.session_state["hospedaje"],
-        "Alimentación por día (persona)": st.session_state["alimentacion"],
-        "Hotel total": round(hotel_total, 2),
-        "Comidas total": round(alimentos_total, 2),
-        "Medio transporte": st.session_state["medio"],
-        "Detalle transporte": detalle_transporte,
-        "Transporte total": round(transporte_total, 2),
-        "Otros": round(otros_total, 2),
-        "TOTAL VIÁTICOS": round(total_viaticos, 2)
-    }])
-
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False, sheet_name="Viaticos")
-        auto_ajustar_columnas(writer, df, "Viaticos")
+        st.write(f"- Habitaciones requeridas: **{r['rooms']}**")
+        st.write(f"- Hospedaje por día (todas las hab.): **${r['hotel_dia']:,.2f}**")
+        st.write(f"- Alimentación por día (todas las personas): **${r['alimentos_dia']:,.2f}**")
+        nota = NOTA_ESTIMADA if r.get("distancia_estimada") else ""
+        st.write(f"- Transporte: {r['detalle_transporte']}{nota}")
 
+    # ---- Archivo: se genera sólo al descargar (el Excel se reutiliza si ya existe) ----
+    formato = st.selectbox("Formato", formatos_disponibles(), format_func=etiqueta_formato, key="formato_viaje")
+    _, extension, mime = FORMATOS[formato]
     st.download_button(
-        "🗎 Descargar resultado en Excel",
-        data=output.getvalue(),
-        file_name="viaticos.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        f"🗎 Descargar resultado ({extension})",
+        data=partial(exportar_viaje, r, formato),
+        file_name=f"viaticos{extension}",
+        mime=mime,
+        on_click="ignore",
         use_container_width=True
     )
 
+
+@st.fragment
+@medido("fragmento", seccion="carga_masiva")
+def seccion_carga_masiva():
+    with st.expander("📤 Carga masiva de viajes (CSV / Excel)"):
+        st.caption("Una fila por viaje con las columnas: " + ", ".join(DEFAULTS)
+                   + ". Opcional: plazas (plazas de cobro separadas por |) para calcular casetas.")
+        archivo = st.file_uploader("Archivo de viajes", type=["csv", "xlsx"], key="archivo_lote")
+        # CSV / Parquet / Arrow se escriben por bloques directo a disco
+        formato = st.selectbox("Formato del resultado", formatos_disponibles(),
+                               format_func=etiqueta_formato, key="formato_lote")
+        if archivo is not None and st.button("Costear archivo", use_container_width=True):
+            barra = st.progress(0.0, text="Costeando viajes...")
+
+            def avance(fraccion, filas):
+                barra.progress(fraccion or 0.0, text=f"{filas:,} viajes costeados")
+
+            anterior = st.session_state.pop("lote_archivo", None)
+            if anterior and os.path.exists(anterior):
+                os.remove(anterior)
+            # Las distancias faltantes de viajes en Auto se resuelven por bloques de Distance Matrix
+            api_key = os.getenv("GOOGLE_MAPS_API_KEY", "")
+            resolver = partial(resolver_distancias_matriz, api_key=api_key) if api_key else None
+            try:
+                ruta, filas = costear_archivo(archivo, archivo.name, progreso=avance, resolver=resolver,
+                                              formato=formato)
+            except Exception as e:
+                st.warning(f"No se pudo procesar el archivo: {e}")
+            else:
+                barra.progress(1.0, text=f"{filas:,} viajes costeados")
+                st.session_state["lote_archivo"] = ruta
+                st.session_state["lote_filas"] = filas
+                st.session_state["lote_formato"] = formato
+
+        ruta = st.session_state.get("lote_archivo")
+        if ruta and os.path.exists(ruta):
+            # El archivo vive en disco; se lee sólo cuando el usuario descarga
+            _, extension, mime = FORMATOS[st.session_state["lote_formato"]]
+            st.download_button(
+                f"🗎 Descargar {st.session_state['lote_filas']:,} viajes costeados ({extension})",
+                data=Path(ruta).read_bytes,
+                file_name=f"viaticos_lote{extension}",
+                mime=mime,
+                on_click="ignore",
+                use_container_width=True
+            )
+
+
+seccion_datos_base()
+st.divider()
+seccion_transporte()
+seccion_resultados()
+# Carga masiva
+seccion_carga_masiva()
+
 # Botón reset
 st.button("Reiniciar formulario", type="secondary", on_click=reset_form, use_container_width=True)
+
+# Rerun completo (los reruns de fragmentos se miden en fragmento_seconds)
+get_metricas().observar("rerun_seconds", time.perf_counter() - _inicio_rerun)
+get_metricas().exportar_si_toca()
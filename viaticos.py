@@ -0,0 +1,175 @@
+"""
+Costeo masivo desde la línea de comandos, sin el servidor de Streamlit.
+
+    python viaticos.py batch viajes.csv viaticos.xlsx --workers 16 --chunk-size 5000
+    python viaticos.py matriz sucursales.csv --fuente google
+
+El archivo se lee en bloques en el proceso principal, cada bloque se costea
+en un pool de procesos (distancias por el caché de rutas en SQLite, que
+comparten todos los workers) y los resultados se escriben en orden en un solo
+archivo (.xlsx, CSV, Parquet o Arrow) con el layout de la hoja "Viaticos".
+
+Con GOOGLE_MAPS_API_KEY las distancias faltantes se consultan a Distance
+Matrix; el límite de tasa (VIATICOS_RATE_GOOGLE_MATRIX) es por proceso, así
+que el límite total es ese valor por el número de workers.
+
+`matriz` precalcula las distancias (y las casetas de la tabla de casetas)
+entre todas las ciudades de un CSV (columna `nombre`, opcional `alias`) en
+VIATICOS_MATRIZ_DIR; la página, el servicio y `batch` la consultan antes que
+al caché de rutas.
+
+`batch` también llena las casetas de los viajes en auto que las traen en 0
+(columna opcional `plazas` con la secuencia de plazas de cobro).
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from calculos import DEFAULTS
+from lotes import CHUNK_SIZE, ESCRITORES, costear_bloque, formato_de_ruta, leer_viajes_en_bloques
+
+
+def _costear(bloque):
+    # Corre en el worker: resolver y caché de rutas propios del proceso
+    from proveedores import resolver_distancias_matriz
+
+    api_key = os.getenv("GOOGLE_MAPS_API_KEY", "")
+    resolver = partial(resolver_distancias_matriz, api_key=api_key) if api_key else None
+    return costear_bloque(bloque, resolver)
+
+
+def costear_en_paralelo(bloques, workers, en_vuelo=None):
+    """
+    Genera (tabla, fracción) en el mismo orden que `bloques`, costeando hasta
+    `en_vuelo` bloques a la vez (por defecto 2 por worker) para acotar la memoria.
+    """
+    en_vuelo = en_vuelo or 2 * workers
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pendientes = deque()
+        for bloque, fraccion in bloques:
+            pendientes.append((pool.submit(_costear, bloque), fraccion))
+            if len(pendientes) >= en_vuelo:
+                futuro, f = pendientes.popleft()
+                yield futuro.result(), f
+        while pendientes:
+            futuro, f = pendientes.popleft()
+            yield futuro.result(), f
+
+
+def batch(entrada, salida, workers=None, chunk_size=CHUNK_SIZE, progreso=None):
+    """Costea `entrada` (CSV/XLSX) en `salida` (.xlsx, .csv, .parquet o .arrow). Devuelve las filas escritas."""
+    workers = workers or os.cpu_count() or 1
+    bloques = leer_viajes_en_bloques(entrada, entrada, chunk_size)
+    if workers > 1:
+        tablas = costear_en_paralelo(bloques, workers)
+    else:
+        tablas = ((_costear(bloque), fraccion) for bloque, fraccion in bloques)
+    return ESCRITORES[formato_de_ruta(salida)](tablas, salida, progreso)
+
+
+def _resolver_matriz(fuente):
+    """Resolver (pares, pais=...) -> [km o None] para construir la matriz (sin leer la matriz vigente)."""
+    from cache_rutas import get_route_cache
+    from proveedores import resolver_distancias, resolver_distancias_matriz
+
+    if fuente == "cache":
+        cache = get_route_cache()
+        return lambda pares, pais="": [cache.get(o, d, pais) for o, d in pares]
+    if fuente == "google":
+        api_key = os.getenv("GOOGLE_MAPS_API_KEY", "")
+        return partial(resolver_distancias_matriz, api_key=api_key, usar_matriz=False) if api_key else None
+    api_key = os.getenv("ORS_API_KEY", "")
+    return partial(resolver_distancias, proveedor="ors", api_key=api_key, usar_matriz=False) if api_key else None
+
+
+def matriz(ciudades_csv, carpeta, fuente="google", pais="", progreso=None):
+    """
+    Construye la matriz de distancias (y casetas, si hay tabla) de las
+    ciudades de `ciudades_csv` en `carpeta`. Devuelve (ciudades, rutas con km).
+    """
+    from casetas import get_tabla_casetas
+    from matriz_rutas import construir_matriz, leer_ciudades
+
+    resolver = _resolver_matriz(fuente)
+    if resolver is None:
+        raise ValueError(f"Falta la API key de {fuente}")
+    tabla = get_tabla_casetas()
+    casetas = (lambda pares, pais="": tabla.por_ruta_lote(*zip(*pares))) if len(tabla) else None
+    ciudades = leer_ciudades(ciudades_csv)
+    return len(ciudades), construir_matriz(ciudades, carpeta, resolver, pais=pais, fuente=fuente,
+                                           casetas=casetas, progreso=progreso)
+
+
+def _progreso_consola(inicio):
+    def avance(fraccion, filas):
+        pct = f"{fraccion:6.1%}" if fraccion is not None else "   ..."
+        print(f"\r{pct}  {filas:,} viajes  {time.perf_counter() - inicio:6.1f} s",
+              end="", file=sys.stderr, flush=True)
+    return avance
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="viaticos", description="Calculadora de viáticos (línea de comandos)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("batch", help="costea un archivo de viajes (CSV/XLSX) a .xlsx, .csv, .parquet o .arrow")
+    p.add_argument("entrada", help="viajes, una fila por viaje con las columnas de DEFAULTS")
+    p.add_argument("salida", help="destino .xlsx (hoja Viaticos), .csv, .parquet o .arrow")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                   help="procesos para costear (default: núcleos disponibles)")
+    p.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="viajes por bloque")
+    p.add_argument("-q", "--quiet", action="store_true", help="sin progreso en stderr")
+
+    p = sub.add_parser("matriz", help="precalcula la matriz de distancias entre las ciudades de un CSV")
+    p.add_argument("ciudades", help="CSV con columna nombre (y opcional alias, separados por |)")
+    p.add_argument("--carpeta", default=None, help="destino (default: VIATICOS_MATRIZ_DIR)")
+    p.add_argument("--fuente", choices=["google", "ors", "cache"], default="google",
+                   help="de dónde salen las distancias; cache no usa la red")
+    p.add_argument("--pais", default=DEFAULTS["pais"], help="país de las rutas (el de la llave del caché)")
+    p.add_argument("-q", "--quiet", action="store_true", help="sin progreso en stderr")
+    args = parser.parse_args(argv)
+
+    if args.comando == "matriz":
+        return _main_matriz(parser, args)
+    if args.workers < 1 or args.chunk_size < 1:
+        parser.error("--workers y --chunk-size deben ser >= 1")
+    if not os.path.exists(args.entrada):
+        parser.error(f"no existe {args.entrada}")
+
+    inicio = time.perf_counter()
+    filas = batch(args.entrada, args.salida, args.workers, args.chunk_size,
+                  None if args.quiet else _progreso_consola(inicio))
+    if not args.quiet:
+        print(file=sys.stderr)
+    print(f"{filas:,} viajes costeados en {time.perf_counter() - inicio:.1f} s -> {args.salida}")
+    return 0
+
+
+def _main_matriz(parser, args):
+    from matriz_rutas import MATRIZ_DIR
+
+    if not os.path.exists(args.ciudades):
+        parser.error(f"no existe {args.ciudades}")
+    carpeta = args.carpeta or MATRIZ_DIR
+    inicio = time.perf_counter()
+
+    def avance(fraccion):
+        print(f"\r{fraccion:6.1%}  {time.perf_counter() - inicio:6.1f} s", end="", file=sys.stderr, flush=True)
+
+    try:
+        n, rutas = matriz(args.ciudades, carpeta, args.fuente, args.pais, None if args.quiet else avance)
+    except ValueError as e:
+        parser.error(str(e))
+    if not args.quiet:
+        print(file=sys.stderr)
+    print(f"{n:,} ciudades, {rutas:,} de {n * (n - 1):,} rutas con distancia en "
+          f"{time.perf_counter() - inicio:.1f} s -> {carpeta}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())